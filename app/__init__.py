@@ -1,22 +1,52 @@
 from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
 from flask_security import Security, SQLAlchemyUserDatastore
 from flask_restful import Api
 from config import config
+from app.cache import Cache
+from app.database import RoutingSQLAlchemy
+from app.uploads import UploadRequest
+from app.thumbnails import Thumbnailer
+from app.search import SearchIndex
+from app.metrics import Metrics
+from app.compression import Compress
+from app.background import Background
+from app.popularity import ViewCounter
+from app.comments import CommentQueue
 
-db = SQLAlchemy()
+db = RoutingSQLAlchemy()
 security = Security()
+cache = Cache()
+thumbnailer = Thumbnailer()
+search = SearchIndex()
+metrics = Metrics()
+compress = Compress()
+background = Background()
+view_counter = ViewCounter()
+comment_queue = CommentQueue()
 
 from app.models import User, Role
 user_datastore = SQLAlchemyUserDatastore(db, User, Role)
 
+from app.auth import TokenCache
+token_cache = TokenCache()
+
 def create_app(config_name):
     app = Flask(__name__)
+    app.request_class = UploadRequest
     app.config.from_object(config[config_name])
     config[config_name].init_app(app)
 
     db.init_app(app)
     security.init_app(app, user_datastore)
+    cache.init_app(app)
+    token_cache.init_app(app)
+    thumbnailer.init_app(app)
+    search.init_app(app)
+    metrics.init_app(app)
+    compress.init_app(app)
+    background.init_app(app)
+    view_counter.init_app(app)
+    comment_queue.init_app(app)
     
     from app.resources import api as api_bluprint
     app.register_blueprint(api_bluprint, url_prefix='/api')
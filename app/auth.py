@@ -0,0 +1,122 @@
+"""
+   app.auth
+   In-process cache of auth token -> user lookups for flask-security
+"""
+
+import hashlib
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import make_transient_to_detached
+from sqlalchemy.orm.attributes import set_committed_value
+from app import db, cache
+from app.cache import SimpleCache
+from app.models import User
+
+
+def _request_token(request):
+    """
+    extract the auth token the same way flask-security's request loader does
+    """
+    state = current_app.extensions['security']
+    token = request.args.get(state.token_authentication_key,
+                             request.headers.get(state.token_authentication_header))
+    if request.is_json:
+        data = request.get_json(silent=True) or {}
+        if isinstance(data, dict):
+            token = data.get(state.token_authentication_key, token)
+    return token
+
+
+def _detached_copy(instance):
+    """
+    copy the loaded columns of instance into a new detached object, without
+    firing attribute events
+    """
+    mapper = inspect(instance).mapper
+    copy = mapper.class_manager.new_instance()
+    for attr in mapper.column_attrs:
+        set_committed_value(copy, attr.key, getattr(instance, attr.key))
+    return copy
+
+
+def _snapshot(user):
+    copy = _detached_copy(user)
+    roles = [_detached_copy(role) for role in user.roles]
+    for role in roles:
+        make_transient_to_detached(role)
+    set_committed_value(copy, 'roles', roles)
+    make_transient_to_detached(copy)
+    return copy
+
+
+def _user_version(user_id):
+    return cache.version('user:{}'.format(user_id))
+
+
+class TokenCache(object):
+    """
+    Wraps flask-security's user loaders, for session cookies and auth tokens.
+    A hit merges a detached snapshot of the user and its roles into the
+    session without touching the database. Entries are checked against a per
+    user version, bumped whenever the user's password, roles or active flag
+    change, and expire after AUTH_TOKEN_CACHE_TIMEOUT seconds, which bounds
+    staleness in other workers when the cache backend is not shared.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('AUTH_TOKEN_CACHE_TIMEOUT', 60)
+        app.config.setdefault('AUTH_TOKEN_CACHE_THRESHOLD', 1024)
+        login_manager = app.extensions['security'].login_manager
+        app.extensions['token_cache'] = {
+            'users': SimpleCache(app.config['AUTH_TOKEN_CACHE_THRESHOLD']),
+            'user_loader': login_manager.user_callback,
+            'request_loader': login_manager.request_callback,
+        }
+        login_manager.user_loader(self.load_user)
+        login_manager.request_loader(self.load_user_from_request)
+
+    def load_user(self, user_id):
+        state = current_app.extensions['token_cache']
+        return self._cached('id:{}'.format(user_id), lambda: state['user_loader'](user_id))
+
+    def load_user_from_request(self, request):
+        state = current_app.extensions['token_cache']
+        token = _request_token(request)
+        if not token:
+            return state['request_loader'](request)
+        key = 'token:' + hashlib.sha1(token.encode('utf-8')).hexdigest()
+        return self._cached(key, lambda: state['request_loader'](request))
+
+    @staticmethod
+    def _cached(key, load):
+        state = current_app.extensions['token_cache']
+        timeout = current_app.config['AUTH_TOKEN_CACHE_TIMEOUT']
+        if not timeout:
+            return load()
+
+        entry = state['users'].get(key)
+        if entry is not None:
+            user_id, version, snapshot = entry
+            if version == _user_version(user_id):
+                return db.session.merge(snapshot, load=False)
+
+        user = load()
+        if user is not None and user.is_authenticated:
+            state['users'].set(key, (user.id, _user_version(user.id), _snapshot(user)), timeout)
+        return user
+
+    @staticmethod
+    def invalidate(user_id):
+        if user_id is not None and has_app_context() and 'token_cache' in current_app.extensions:
+            cache.bump('user:{}'.format(user_id))
+
+
+def _user_changed(target, *args):
+    TokenCache.invalidate(target.id)
+
+
+event.listen(User.password, 'set', _user_changed)
+event.listen(User.active, 'set', _user_changed)
+event.listen(User.roles, 'append', _user_changed)
+event.listen(User.roles, 'remove', _user_changed)
+event.listen(User, 'after_delete', lambda mapper, connection, target: _user_changed(target))
@@ -0,0 +1,124 @@
+"""
+   app.background
+   Periodic jobs flushing in-process buffers, run in a daemon thread of each
+   worker process
+"""
+
+import atexit
+import logging
+import os
+import threading
+from flask import current_app, has_app_context
+
+logger = logging.getLogger(__name__)
+
+
+class Job(object):
+    """
+    calls func inside an app context every interval seconds, or sooner when woken.
+    The thread is started on first use in each process, so a worker forked from a
+    preloaded master starts its own.
+    """
+
+    def __init__(self, app, name, func, interval):
+        self.app = app
+        self.name = name
+        self.func = func
+        self.interval = interval
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def start(self):
+        """
+        start the thread of this process if it is not running, a no-op when interval is 0
+        """
+        if not self.interval or (self._pid == os.getpid() and self._thread is not None):
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name='flush-' + self.name, daemon=True)
+            self._pid = os.getpid()
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def wake(self):
+        """
+        run the job now instead of at the end of the interval
+        """
+        self._wake.set()
+
+    def run_once(self):
+        if has_app_context() and current_app._get_current_object() is self.app:
+            return self._call()
+        with self.app.app_context():
+            self._call()
+
+    def _call(self):
+        try:
+            self.func()
+        except Exception:
+            logger.exception('background job %s failed', self.name)
+
+    def stop(self, timeout=10):
+        """
+        stop the thread after a last run, so nothing buffered is lost at shutdown
+        """
+        thread = self._thread
+        if thread is None or self._pid != os.getpid():
+            return
+        self._stop.set()
+        self._wake.set()
+        thread.join(timeout)
+        self._thread = None
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            stopping = self._stop.is_set()
+            self.run_once()
+            if stopping:
+                return
+
+
+class Background(object):
+    """
+    flask extension keeping the jobs of an app
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.extensions['background'] = {}
+
+    @staticmethod
+    def add_job(app, name, func, interval):
+        """
+        register func to run every interval seconds once started, 0 only runs it
+        when flushed explicitly
+        @return: the Job
+        """
+        job = Job(app, name, func, interval)
+        app.extensions['background'][name] = job
+        return job
+
+    @staticmethod
+    def flush(app, name=None):
+        """
+        run the named job, or every job, in the calling thread
+        """
+        jobs = app.extensions['background']
+        for job in [jobs[name]] if name else list(jobs.values()):
+            job.run_once()
+
+    @staticmethod
+    def stop(app):
+        for job in app.extensions['background'].values():
+            job.stop()
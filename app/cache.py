@@ -0,0 +1,193 @@
+"""
+   app.cache
+   Cache for public read endpoints, backed by an in-process LRU or redis
+"""
+
+import pickle
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from flask import current_app
+from app.database import primary_reads
+
+
+class NullCache(object):
+    """
+    backend that never stores anything
+    """
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, timeout):
+        pass
+
+    def delete(self, *keys):
+        pass
+
+    def clear(self):
+        pass
+
+
+class SimpleCache(object):
+    """
+    in-process LRU backend with per key expiry, only consistent within one process
+    """
+
+    def __init__(self, threshold=1000):
+        self._threshold = threshold
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is None:
+                return None
+            expires, value = item
+            if expires and expires < time.time():
+                del self._items[key]
+                return None
+            self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value, timeout):
+        expires = time.time() + timeout if timeout else 0
+        with self._lock:
+            self._items[key] = (expires, value)
+            self._items.move_to_end(key)
+            while len(self._items) > self._threshold:
+                self._items.popitem(last=False)
+
+    def delete(self, *keys):
+        with self._lock:
+            for key in keys:
+                self._items.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+
+class RedisCache(object):
+    """
+    backend for anything speaking the redis protocol, shared by all workers
+    """
+
+    def __init__(self, client, key_prefix=''):
+        self._client = client
+        self._prefix = key_prefix
+
+    def get(self, key):
+        value = self._client.get(self._prefix + key)
+        if value is None:
+            return None
+        return pickle.loads(value)
+
+    def set(self, key, value, timeout):
+        self._client.set(self._prefix + key, pickle.dumps(value, pickle.HIGHEST_PROTOCOL), ex=timeout or None)
+
+    def delete(self, *keys):
+        if keys:
+            self._client.delete(*[self._prefix + key for key in keys])
+
+    def clear(self):
+        keys = list(self._client.scan_iter(match=self._prefix + '*'))
+        if keys:
+            self._client.delete(*keys)
+
+
+def _redis_backend(app):
+    import redis
+    client = redis.StrictRedis.from_url(app.config['CACHE_REDIS_URL'])
+    return RedisCache(client, app.config['CACHE_KEY_PREFIX'])
+
+
+backends = {
+    'null': lambda app: NullCache(),
+    'simple': lambda app: SimpleCache(app.config['CACHE_THRESHOLD']),
+    'redis': _redis_backend,
+}
+
+
+class Cache(object):
+    """
+    flask extension choosing the backend from CACHE_TYPE and counting hits and misses
+    """
+
+    def __init__(self, app=None):
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app, backend=None):
+        app.config.setdefault('CACHE_TYPE', 'simple')
+        app.config.setdefault('CACHE_DEFAULT_TIMEOUT', 300)
+        app.config.setdefault('CACHE_THRESHOLD', 1000)
+        app.config.setdefault('CACHE_KEY_PREFIX', 'blog:')
+        if backend is None:
+            backend = backends[app.config['CACHE_TYPE']](app)
+        app.extensions['cache'] = {'backend': backend, 'hits': 0, 'misses': 0}
+
+    @property
+    def _state(self):
+        return current_app.extensions['cache']
+
+    def get(self, key):
+        state = self._state
+        value = state['backend'].get(key)
+        with self._lock:
+            if value is None:
+                state['misses'] += 1
+            else:
+                state['hits'] += 1
+        return value
+
+    def set(self, key, value, timeout=None):
+        if timeout is None:
+            timeout = current_app.config['CACHE_DEFAULT_TIMEOUT']
+        self._state['backend'].set(key, value, timeout)
+
+    def get_or_set(self, key, func, timeout=None):
+        """
+        return the cached value of key, calling func to fill it on a miss. func
+        reads from the primary, every request of every worker is served the value.
+        """
+        value = self.get(key)
+        if value is None:
+            with primary_reads():
+                value = func()
+            self.set(key, value, timeout)
+        return value
+
+    def delete(self, *keys):
+        self._state['backend'].delete(*keys)
+
+    def version(self, namespace):
+        """
+        current version token of a namespace of keys, used to drop them all at once
+        """
+        backend = self._state['backend']
+        version = backend.get('version:' + namespace)
+        if version is None:
+            version = self.bump(namespace)
+        return version
+
+    def bump(self, namespace):
+        # a random token rather than a counter, so an evicted version can
+        # never bring back keys of an older generation
+        version = uuid.uuid4().hex[:12]
+        self._state['backend'].set('version:' + namespace, version, 0)
+        return version
+
+    def clear(self):
+        self._state['backend'].clear()
+
+    def stats(self):
+        state = self._state
+        return {
+            'backend': type(state['backend']).__name__,
+            'hits': state['hits'],
+            'misses': state['misses'],
+        }
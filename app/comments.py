@@ -0,0 +1,236 @@
+"""
+   app.comments
+   Optional queue of accepted comments written in batches by a background job,
+   with ids allocated up front from blocks reserved in the id_sequence table
+"""
+
+import logging
+import os
+import threading
+from collections import Counter
+from datetime import datetime
+from queue import Queue, Full, Empty
+from flask import current_app
+from flask.signals import Namespace
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.exc import IntegrityError, DataError
+
+logger = logging.getLogger(__name__)
+
+signals = Namespace()
+# sent with the app and the ids of the posts whose comments were just committed
+comments_written = signals.signal('comments-written')
+
+
+class QueueFull(Exception):
+    pass
+
+
+class HiLoAllocator(object):
+    """
+    ids of table handed out from blocks of block_size reserved in the id_sequence
+    row of name, one short transaction per block. Blocks never overlap between
+    processes, ids a process did not use before exiting are skipped. A block
+    starts above the largest id of table, so rows inserted with ids of their
+    own, by an import for instance, are never handed out again. The reverse
+    does not hold, an autoincrement insert may take an id of a block reserved
+    but not used yet, so every writer of table has to take its ids from here.
+    """
+
+    def __init__(self, name, table, block_size=100):
+        self.name = name
+        self.table = table
+        self.block_size = block_size
+        self._lock = threading.Lock()
+        self._next = self._end = 0
+        self._pid = None
+
+    def next_id(self):
+        with self._lock:
+            if self._next >= self._end or self._pid != os.getpid():
+                self._next, self._end = self._reserve()
+                self._pid = os.getpid()
+            allocated = self._next
+            self._next += 1
+            return allocated
+
+    def _reserve(self):
+        from app import db
+        from app.models import IdSequence
+        sequence = IdSequence.__table__
+        row = sequence.c.name == self.name
+        for attempt in range(2):
+            try:
+                with db.engine.begin() as connection:
+                    # the update locks the row until the block is settled
+                    if connection.execute(sequence.update().where(row)
+                                          .values(next_value=sequence.c.next_value + self.block_size)).rowcount:
+                        start = connection.execute(select([sequence.c.next_value]).where(row)).scalar() \
+                            - self.block_size
+                    else:
+                        start = 1
+                        connection.execute(sequence.insert().values(name=self.name,
+                                                                    next_value=start + self.block_size))
+                    largest = connection.execute(select([func.max(self.table.c.id)])).scalar() or 0
+                    if start <= largest:
+                        start = largest + 1
+                        connection.execute(sequence.update().where(row)
+                                           .values(next_value=start + self.block_size))
+                    return start, start + self.block_size
+            except IntegrityError:
+                # another process created the row first, take a block of it
+                if attempt:
+                    raise
+
+
+class CommentQueue(object):
+    """
+    flask extension queueing comments for COMMENT_FLUSH_INTERVAL seconds at most,
+    the writer is woken early once COMMENT_BATCH_SIZE are waiting. A full queue
+    raises QueueFull, a failed batch is retried before anything new is taken, so
+    the queue fills up and pushes back while the database is unavailable.
+    After COMMENT_RETRY_LIMIT failures the batch is written row by row, and the
+    rows the database rejects are logged and dropped, so one bad comment does
+    not hold back the others. Comments still queued when a worker exits are
+    written by its last flush.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import background
+        from app.models import Comment
+        app.config.setdefault('COMMENT_QUEUE_ENABLED', False)
+        app.config.setdefault('COMMENT_QUEUE_SIZE', 10000)
+        app.config.setdefault('COMMENT_BATCH_SIZE', 500)
+        app.config.setdefault('COMMENT_FLUSH_INTERVAL', 1)
+        app.config.setdefault('COMMENT_ID_BLOCK_SIZE', 100)
+        app.config.setdefault('COMMENT_RETRY_LIMIT', 3)
+        app.extensions['comments'] = {
+            'queue': Queue(app.config['COMMENT_QUEUE_SIZE']),
+            'retry': [],
+            'attempts': 0,
+            'ids': HiLoAllocator('comment', Comment.__table__, app.config['COMMENT_ID_BLOCK_SIZE']),
+            'job': background.add_job(app, 'comments', self.flush, app.config['COMMENT_FLUSH_INTERVAL']),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['comments']
+
+    def put(self, body, post_id, author_id):
+        """
+        queue a validated comment
+        @return: the row that will be inserted, with its id
+        """
+        state = self._state
+        if state['queue'].full():
+            raise QueueFull
+        now = datetime.utcnow()
+        row = {'id': state['ids'].next_id(), 'body': body, 'created_time': now, 'updated_time': now,
+               'author_id': author_id, 'post_id': post_id}
+        try:
+            state['queue'].put_nowait(row)
+        except Full:
+            raise QueueFull
+        state['job'].start()
+        if state['queue'].qsize() >= current_app.config['COMMENT_BATCH_SIZE']:
+            state['job'].wake()
+        return row
+
+    @staticmethod
+    def _take(queue, size):
+        rows = []
+        while len(rows) < size:
+            try:
+                rows.append(queue.get_nowait())
+            except Empty:
+                break
+        return rows
+
+    def flush(self):
+        """
+        write every queued comment, COMMENT_BATCH_SIZE per transaction
+        @return: number of comments written, dropped ones excluded
+        """
+        state = self._state
+        written = 0
+        while True:
+            batch = state['retry'] or self._take(state['queue'], current_app.config['COMMENT_BATCH_SIZE'])
+            if not batch:
+                return written
+            state['retry'] = batch
+            if state['attempts'] >= current_app.config['COMMENT_RETRY_LIMIT']:
+                post_ids, count = self._write_each(state)
+            else:
+                try:
+                    post_ids, count = self._write(batch), len(batch)
+                except Exception:
+                    state['attempts'] += 1
+                    raise
+            state['retry'] = []
+            state['attempts'] = 0
+            written += count
+            comments_written.send(current_app._get_current_object(), post_ids=post_ids)
+
+    def _write_each(self, state):
+        """
+        write the retried batch one row at a time, dropping the rows the database
+        rejects. Any other error leaves the rows not written yet to be retried.
+        @return: (ids of the posts that got comments, number of comments written)
+        """
+        post_ids = set()
+        count = 0
+        while state['retry']:
+            row = state['retry'][0]
+            try:
+                post_ids.update(self._write([row]))
+                count += 1
+            except (IntegrityError, DataError):
+                logger.exception('dropped comment %r after %d failed batches', row, state['attempts'])
+            except Exception:
+                if post_ids:
+                    comments_written.send(current_app._get_current_object(), post_ids=sorted(post_ids))
+                raise
+            state['retry'].pop(0)
+        return sorted(post_ids), count
+
+    @staticmethod
+    def _write(rows):
+        """
+        insert rows and add them to comment_count in one transaction, dropping the
+        comments of posts deleted since they were accepted
+        @return: ids of the posts that got comments
+        """
+        from app import db
+        from app.models import Post, Comment
+        post = Post.__table__
+        counts = Counter(row['post_id'] for row in rows)
+        try:
+            existing = set(post_id for post_id, in db.session.query(Post.id).filter(Post.id.in_(list(counts))))
+            if len(existing) < len(counts):
+                logger.warning('dropped the comments of deleted posts %s', sorted(set(counts) - existing))
+                rows = [row for row in rows if row['post_id'] in existing]
+            if rows:
+                db.session.execute(Comment.__table__.insert(), rows)
+                db.session.execute(post.update().where(post.c.id == bindparam('post')).values(
+                    comment_count=post.c.comment_count + bindparam('n')),
+                    [{'post': post_id, 'n': counts[post_id]} for post_id in sorted(existing)])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        return sorted(existing)
+
+    def next_id(self):
+        """
+        id of a comment written right away, from the blocks the queued ones use,
+        so the two write paths can run side by side
+        """
+        return self._state['ids'].next_id()
+
+    def pending(self):
+        state = self._state
+        return state['queue'].qsize() + len(state['retry'])
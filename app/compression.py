@@ -0,0 +1,108 @@
+"""
+   app.compression
+   gzip and brotli compression of responses negotiated from Accept-Encoding,
+   with the compressed bytes of cached representations kept by their etag
+"""
+
+import gzip
+from flask import request, current_app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def _gzip(data, app):
+    return gzip.compress(data, app.config['COMPRESS_LEVEL'])
+
+
+def _brotli(data, app):
+    return brotli.compress(data, quality=app.config['COMPRESS_BROTLI_QUALITY'])
+
+
+def available_encodings():
+    """
+    content codings this process can produce, preferred first
+    """
+    encoders = [('br', _brotli)] if brotli is not None else []
+    encoders.append(('gzip', _gzip))
+    return encoders
+
+
+def choose_encoding(accept_encodings, encoders):
+    """
+    the encoder the client weighs highest, the earlier one on ties,
+    or None when identity is preferred or nothing acceptable is available
+    """
+    best, best_quality = None, 0
+    for name, encoder in encoders:
+        quality = accept_encodings[name]
+        if quality > best_quality:
+            best, best_quality = (name, encoder), quality
+    return best
+
+
+class Compress(object):
+    """
+    compresses responses in after_request. Vary: Accept-Encoding is set on every
+    response that may be compressed, including 304s, and the ETag of a compressed
+    response becomes weak since its bytes differ from the identity representation.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_ENABLED', True)
+        app.config.setdefault('COMPRESS_MIMETYPES', ['application/json', 'text/html', 'text/plain', 'text/css',
+                                                     'application/javascript'])
+        app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        app.config.setdefault('COMPRESS_BROTLI_QUALITY', 4)
+        app.config.setdefault('COMPRESS_CACHE', True)
+        app.config.setdefault('COMPRESS_CACHE_TIMEOUT', 60)
+        app.extensions['compress'] = {'encoders': available_encodings()}
+        if app.config['COMPRESS_ENABLED']:
+            app.after_request(self._after_request)
+
+    @staticmethod
+    def compress(data, name, encoder, etag=None):
+        """
+        compressed data, from the cache when the representation of etag was
+        compressed before. Only the resources answering conditional GETs have
+        a strong etag, those whose bodies come from the response cache, so
+        search results or metrics never take the room of cached posts.
+        @param: data, name of the content coding, encoder, strong etag of data
+        """
+        app = current_app._get_current_object()
+        if not app.config['COMPRESS_CACHE'] or request.method != 'GET' or etag is None:
+            return encoder(data, app)
+        from app import cache
+        key = 'compressed:{}:{}'.format(name, etag)
+        return cache.get_or_set(key, lambda: encoder(data, app), app.config['COMPRESS_CACHE_TIMEOUT'])
+
+    def _after_request(self, response):
+        if response.status_code == 304:
+            response.vary.add('Accept-Encoding')
+            return response
+        if response.direct_passthrough or response.is_streamed or 'Content-Encoding' in response.headers \
+                or response.mimetype not in current_app.config['COMPRESS_MIMETYPES'] \
+                or not 200 <= response.status_code < 300:
+            return response
+        data = response.get_data()
+        if len(data) < current_app.config['COMPRESS_MIN_SIZE']:
+            return response
+
+        response.vary.add('Accept-Encoding')
+        chosen = choose_encoding(request.accept_encodings, current_app.extensions['compress']['encoders'])
+        if chosen is None:
+            return response
+        name, encoder = chosen
+        etag, weak = response.get_etag()
+        response.set_data(self.compress(data, name, encoder, etag if etag and not weak else None))
+        response.headers['Content-Encoding'] = name
+        if etag and not weak:
+            response.set_etag(etag, weak=True)
+        return response
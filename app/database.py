@@ -0,0 +1,137 @@
+"""
+   app.database
+   Connection pool settings and read replica routing for flask-sqlalchemy
+"""
+
+import random
+from contextlib import contextmanager
+from flask import g, request, has_request_context
+from flask_sqlalchemy import SQLAlchemy, SignallingSession, _EngineDebuggingSignalEvents
+from sqlalchemy import create_engine, event, orm
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.sql.dml import UpdateBase
+
+READ_METHODS = ('GET', 'HEAD')
+
+
+def use_primary():
+    """
+    send the rest of the current request to the primary, for reads that must see
+    writes made outside this session
+    """
+    if has_request_context():
+        g.db_primary = True
+
+
+@contextmanager
+def primary_reads():
+    """
+    send the reads of the block to the primary, for values outliving the request,
+    like cache fills, which a lagging replica would keep stale until they expire
+    """
+    if not has_request_context():
+        yield
+        return
+    g.db_primary_reads = g.get('db_primary_reads', 0) + 1
+    try:
+        yield
+    finally:
+        g.db_primary_reads -= 1
+
+
+def _reads_from_replica():
+    return has_request_context() and request.method in READ_METHODS and not g.get('db_primary') \
+        and not g.get('db_primary_reads')
+
+
+class RoutingSession(SignallingSession):
+    """
+    session sending the reads of GET and HEAD requests to a replica, picked once
+    per request. Flushes and DML statements go to the primary and pin the rest
+    of the request to it, so a request always reads its own writes.
+    """
+
+    def get_bind(self, mapper=None, clause=None):
+        bind = SignallingSession.get_bind(self, mapper, clause)
+        replicas = self.app.extensions['replicas']
+        if not replicas or bind is not self.bind:
+            return bind
+        if self._flushing or isinstance(clause, UpdateBase):
+            use_primary()
+            return bind
+        if not _reads_from_replica():
+            return bind
+        if 'db_replica' not in g:
+            g.db_replica = random.choice(replicas)
+        return g.db_replica
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _pin_to_primary(session, flush_context, instances):
+    use_primary()
+
+
+def _reset_routing():
+    g.pop('db_primary', None)
+    g.pop('db_primary_reads', None)
+    g.pop('db_replica', None)
+
+
+class RoutingSQLAlchemy(SQLAlchemy):
+    """
+    flask-sqlalchemy with DATABASE_POOL_* settings applied to every engine and
+    a replica engine for each of DATABASE_REPLICA_URIS
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('DATABASE_POOL_SIZE', None)
+        app.config.setdefault('DATABASE_MAX_OVERFLOW', None)
+        app.config.setdefault('DATABASE_POOL_TIMEOUT', None)
+        app.config.setdefault('DATABASE_POOL_RECYCLE', None)
+        app.config.setdefault('DATABASE_POOL_PRE_PING', False)
+        app.config.setdefault('DATABASE_REPLICA_URIS', [])
+        super(RoutingSQLAlchemy, self).init_app(app)
+
+        replicas = []
+        for uri in app.config['DATABASE_REPLICA_URIS']:
+            engine = create_engine(uri, **self.pool_options(app, uri))
+            if app.debug or app.testing or app.config['SQLALCHEMY_RECORD_QUERIES']:
+                _EngineDebuggingSignalEvents(engine, app.import_name).register()
+            replicas.append(engine)
+        app.extensions['replicas'] = replicas
+        app.before_request(_reset_routing)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    @staticmethod
+    def pool_options(app, uri):
+        """
+        engine options from the DATABASE_POOL_* settings, sqlite has no queue pool
+        so it only gets pre ping
+        """
+        options = {}
+        if app.config['DATABASE_POOL_PRE_PING']:
+            options['pool_pre_ping'] = True
+        if make_url(uri).drivername.startswith('sqlite'):
+            return options
+        for option, key in (('pool_size', 'DATABASE_POOL_SIZE'),
+                            ('max_overflow', 'DATABASE_MAX_OVERFLOW'),
+                            ('pool_timeout', 'DATABASE_POOL_TIMEOUT'),
+                            ('pool_recycle', 'DATABASE_POOL_RECYCLE')):
+            if app.config[key] is not None:
+                options[option] = app.config[key]
+        return options
+
+    def apply_pool_defaults(self, app, options):
+        options = super(RoutingSQLAlchemy, self).apply_pool_defaults(app, options) or options
+        options.update(self.pool_options(app, app.config['SQLALCHEMY_DATABASE_URI']))
+        return options
+
+    def dispose_engines(self, app):
+        """
+        close every pooled connection, in a worker right after the fork
+        """
+        self.get_engine(app).dispose()
+        for engine in app.extensions['replicas']:
+            engine.dispose()
@@ -0,0 +1,191 @@
+"""
+   app.metrics
+   Per endpoint request timing, SQL statistics, slow request logging and
+   sampled cProfile dumps
+"""
+
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+from flask import g, request, current_app, has_request_context
+from flask_sqlalchemy import get_debug_queries
+
+logger = logging.getLogger(__name__)
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+# (metric name, help, key of the per request sample)
+SUMMARIES = (
+    ('blog_request_duration_seconds', 'Wall time of a request', 'duration'),
+    ('blog_request_queries', 'SQL statements run by a request', 'queries'),
+    ('blog_request_sql_seconds', 'Time spent in SQL by a request', 'sql'),
+    ('blog_request_markdown_seconds', 'Time spent rendering markdown in a request', 'markdown'),
+)
+
+
+def record_time(name, seconds):
+    """
+    add seconds to the named timer of the current request, e.g. 'markdown'
+    """
+    if has_request_context():
+        timers = g.setdefault('metrics_timers', {})
+        timers[name] = timers.get(name, 0.0) + seconds
+
+
+def quantile(values, q):
+    """
+    nearest rank quantile of sorted values
+    """
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+class EndpointStats(object):
+    """
+    request count, sums and a sliding window of the latest samples of one endpoint
+    """
+
+    def __init__(self, window):
+        self.count = 0
+        self.sums = dict((key, 0.0) for _, _, key in SUMMARIES)
+        self.samples = dict((key, deque(maxlen=window)) for _, _, key in SUMMARIES)
+
+    def add(self, sample):
+        self.count += 1
+        for key, value in sample.items():
+            self.sums[key] += value
+            self.samples[key].append(value)
+
+
+class Metrics(object):
+    """
+    Measures every request: wall time, number and total time of SQL statements
+    read from get_debug_queries(), and markdown render time. Aggregates are kept
+    per process, so each gunicorn worker reports its own. One in
+    PROFILE_SAMPLE_RATE requests is run under cProfile and dumped to PROFILE_DIR.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('METRICS_ENABLED', True)
+        app.config.setdefault('METRICS_WINDOW', 1024)
+        app.config.setdefault('SLOW_REQUEST_THRESHOLD', 0.5)
+        app.config.setdefault('SLOW_QUERY_THRESHOLD', 0.1)
+        app.config.setdefault('SLOW_QUERIES_LOGGED', 5)
+        app.config.setdefault('PROFILE_SAMPLE_RATE', 0)
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        app.extensions['metrics'] = {
+            'endpoints': {},
+            'lock': threading.Lock(),
+            'profiling': threading.Lock(),
+        }
+        if app.config['METRICS_ENABLED']:
+            app.before_request(self._start)
+            app.after_request(self._finish)
+            app.teardown_request(self._stop_profiler)
+
+    @staticmethod
+    def _start():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = len(get_debug_queries())
+        g.metrics_timers = {}
+        rate = current_app.config['PROFILE_SAMPLE_RATE']
+        if rate and random.random() * rate < 1:
+            state = current_app.extensions['metrics']
+            # cProfile cannot profile two threads of a worker at once
+            if state['profiling'].acquire(False):
+                import cProfile
+                g.profiler = cProfile.Profile()
+                g.profiler.enable()
+
+    @staticmethod
+    def _stop_profiler(exc=None):
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.disable()
+            current_app.extensions['metrics']['profiling'].release()
+        return profiler
+
+    def _finish(self, response):
+        if 'metrics_start' not in g:
+            return response
+        profiler = self._stop_profiler()
+        if profiler is not None:
+            self._dump(profiler)
+
+        duration = time.perf_counter() - g.pop('metrics_start')
+        queries = get_debug_queries()[g.pop('metrics_queries'):]
+        timers = g.pop('metrics_timers', {})
+        sample = {
+            'duration': duration,
+            'queries': len(queries),
+            'sql': sum(query.duration for query in queries),
+            'markdown': timers.get('markdown', 0.0),
+        }
+        endpoint = request.endpoint or 'unmatched'
+        self.add(endpoint, sample)
+
+        config = current_app.config
+        slow_queries = [query for query in queries if query.duration >= config['SLOW_QUERY_THRESHOLD']]
+        if duration >= config['SLOW_REQUEST_THRESHOLD'] or slow_queries:
+            slowest = sorted(queries, key=lambda query: query.duration, reverse=True)
+            logger.warning('slow request %s %s (%s): %.1fms, %d queries, %.1fms sql, %.1fms markdown%s',
+                           request.method, request.full_path, endpoint, duration * 1000, sample['queries'],
+                           sample['sql'] * 1000, sample['markdown'] * 1000,
+                           ''.join('\n  {:.1f}ms {}'.format(query.duration * 1000, query.statement)
+                                   for query in slowest[:config['SLOW_QUERIES_LOGGED']]))
+        return response
+
+    @staticmethod
+    def _dump(profiler):
+        directory = current_app.config['PROFILE_DIR']
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        filename = '{}-{}-{}.prof'.format(request.endpoint or 'unmatched', int(time.time() * 1000), os.getpid())
+        profiler.dump_stats(os.path.join(directory, filename))
+
+    @staticmethod
+    def add(endpoint, sample):
+        state = current_app.extensions['metrics']
+        with state['lock']:
+            stats = state['endpoints'].get(endpoint)
+            if stats is None:
+                stats = state['endpoints'][endpoint] = EndpointStats(current_app.config['METRICS_WINDOW'])
+            stats.add(sample)
+
+    @staticmethod
+    def snapshot():
+        """
+        {endpoint: (count, sums, sorted samples)} of this process
+        """
+        state = current_app.extensions['metrics']
+        with state['lock']:
+            return dict((endpoint, (stats.count, dict(stats.sums),
+                                    dict((key, sorted(values)) for key, values in stats.samples.items())))
+                        for endpoint, stats in state['endpoints'].items())
+
+    def prometheus(self, extra=None):
+        """
+        the aggregates in prometheus text exposition format
+        @param: extra, list of (name, help, type, value) appended as unlabelled metrics
+        """
+        snapshot = self.snapshot()
+        lines = []
+        for name, help, key in SUMMARIES:
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} summary'.format(name))
+            for endpoint in sorted(snapshot):
+                count, sums, samples = snapshot[endpoint]
+                for q in QUANTILES:
+                    lines.append('{}{{endpoint="{}",quantile="{}"}} {}'.format(
+                        name, endpoint, q, quantile(samples[key], q)))
+                lines.append('{}_sum{{endpoint="{}"}} {}'.format(name, endpoint, sums[key]))
+                lines.append('{}_count{{endpoint="{}"}} {}'.format(name, endpoint, count))
+        for name, help, type, value in extra or []:
+            lines.append('# HELP {} {}'.format(name, help))
+            lines.append('# TYPE {} {}'.format(name, type))
+            lines.append('{} {}'.format(name, value))
+        return '\n'.join(lines) + '\n'
@@ -1,9 +1,38 @@
 from app import db
 from flask_security import UserMixin, RoleMixin
 from datetime import datetime
-from flask import Markup
-from markdown import markdown
+from flask import Markup, current_app, g, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import joinedload
+from app.metrics import record_time
+from app.pool import Pool
 import hashlib
+import time
+
+MARKDOWN_EXTENSIONS = [
+    'markdown.extensions.fenced_code',
+    'markdown.extensions.tables',
+    'markdown.extensions.toc']
+
+
+def _new_markdown():
+    """
+    markdown and its extensions are imported and set up on the first render
+    instead of when the app starts
+    """
+    from markdown import Markdown
+    return Markdown(extensions=MARKDOWN_EXTENSIONS)
+
+
+_markdown = Pool(_new_markdown, size=8)
+
+
+def render_markdown(text):
+    start = time.perf_counter()
+    with _markdown.item() as md:
+        html = md.reset().convert(text or '')
+    record_time('markdown', time.perf_counter() - start)
+    return html
 
 roles_users = db.Table('roles_users',
                        db.Column('user_id', db.Integer(), db.ForeignKey('user.id')),
@@ -20,6 +49,8 @@ class User(db.Model, UserMixin):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80))
     email = db.Column(db.String(80), unique=True)
+    # md5 of the normalized email, for gravatar urls, kept in sync by _email_set
+    email_hash = db.Column(db.String(32))
     password = db.Column(db.String(255))
     last_login_at = db.Column(db.DateTime())
     current_login_at = db.Column(db.DateTime())
@@ -34,77 +65,224 @@ class User(db.Model, UserMixin):
     comments = db.relationship('Comment', backref='author', lazy='dynamic')
 
     def avatar(self, size):
-        return 'https://www.gravatar.com/avatar/' + hashlib.md5(
-            self.email.encode('utf-8')).hexdigest() + '?d=retro&s=' + str(size)
+        email_hash = self.email_hash or gravatar_hash(self.email)
+        return 'https://www.gravatar.com/avatar/{}?d=retro&s={}'.format(email_hash, size)
+
+    def to_author_dict(self):
+        """
+        name and avatar of the user as embedded in posts and comments, built
+        once per request for each author
+        """
+        authors = g.setdefault('authors', {}) if has_app_context() else {}
+        author = authors.get(self.id)
+        if author is None:
+            author = authors[self.id] = {'name': self.name, 'avatar': self.avatar(50)}
+        return author
+
+
+def gravatar_hash(email):
+    return hashlib.md5((email or '').strip().lower().encode('utf-8')).hexdigest()
+
+
+@event.listens_for(User.email, 'set')
+def _email_set(target, value, oldvalue, initiator):
+    target.email_hash = gravatar_hash(value) if value is not None else None
 
 
 class Post(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(80))
     body = db.Column(db.Text)
+    body_html = db.Column(db.Text)
+    body_hash = db.Column(db.String(64))
     description = db.Column(db.String(255))
     created_time = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'))
+    # maintained by the Comment insert and delete events below
+    comment_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    # written behind in batches by app.popularity, not part of the cached representations
+    views = db.Column(db.Integer, nullable=False, index=True, default=0, server_default='0')
     comments = db.relationship('Comment', backref='post', lazy='dynamic')
     img = db.relationship('Image', uselist=False, backref='post')
 
-    def to_dict(self):
+    __table_args__ = (db.Index('ix_post_category_id_created_time', 'category_id', 'created_time'),)
+
+    @classmethod
+    def eager_query(cls):
+        """
+        post query loading category, author and img in the same round trip
+        """
+        return cls.query.options(joinedload(cls.category), joinedload(cls.author), joinedload(cls.img))
+
+    @classmethod
+    def recount_comments(cls):
+        """
+        recompute comment_count of every post, after comments were inserted in bulk
+        """
+        count = select([func.count(Comment.id)]).where(Comment.post_id == cls.id).as_scalar()
+        db.session.query(cls).update({cls.comment_count: count}, synchronize_session=False)
+
+    def render_body(self, force=False):
+        """
+        render markdown body into body_html, skipped if the body is unchanged
+        @return: True if the body was rendered
+        """
+        body_hash = hashlib.sha256((self.body or '').encode('utf-8')).hexdigest()
+        if not force and body_hash == self.body_hash and self.body_html is not None:
+            return False
+        self.body_html = render_markdown(self.body)
+        self.body_hash = body_hash
+        return True
+
+    def to_summary_dict(self):
+        author = self.author.to_author_dict()
         return {
             'id': self.id,
             'title': self.title,
-            'body': Markup(markdown(self.body, extensions=[
-                'markdown.extensions.fenced_code',
-                'markdown.extensions.tables',
-                'markdown.extensions.toc'])),
             'category': self.category.name,
             'desc': self.description,
             'img': self.img.to_dict() if self.img else '',
             'created_time': str(self.created_time),
-            'author': self.author.name,
-            'author_avatar': self.author.avatar(50)
+            'author': author['name'],
+            'author_avatar': author['avatar'],
+            'comment_count': self.comment_count
         }
 
+    def to_dict(self):
+        body_html = self.body_html
+        if body_html is None:
+            body_html = render_markdown(self.body)
+        data = self.to_summary_dict()
+        data['body'] = Markup(body_html)
+        return data
+
 
 class Category(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(80), unique=True)
+    # maintained by the Post insert, update and delete events below
+    post_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
     posts = db.relationship('Post', backref='category', lazy='dynamic')
 
+    @classmethod
+    def recount_posts(cls):
+        """
+        recompute post_count of every category, after posts were inserted in bulk
+        """
+        count = select([func.count(Post.id)]).where(Post.category_id == cls.id).as_scalar()
+        db.session.query(cls).update({cls.post_count: count}, synchronize_session=False)
+
     def to_dict(self):
         return {
             'id': self.id,
             'name': self.name,
-            'posts': [p.to_json() for p in self.posts.all()]
+            'post_count': self.post_count
         }
 
 
+def _change_post_count(connection, category_id, delta):
+    if category_id is not None:
+        category = Category.__table__
+        connection.execute(category.update().where(category.c.id == category_id)
+                           .values(post_count=category.c.post_count + delta))
+
+
+@event.listens_for(Post, 'after_insert')
+def _post_inserted(mapper, connection, target):
+    _change_post_count(connection, target.category_id, 1)
+
+
+@event.listens_for(Post, 'after_update')
+def _post_updated(mapper, connection, target):
+    history = inspect(target).attrs.category_id.history
+    if history.has_changes():
+        for category_id in history.deleted:
+            _change_post_count(connection, category_id, -1)
+        for category_id in history.added:
+            _change_post_count(connection, category_id, 1)
+
+
+@event.listens_for(Post, 'after_delete')
+def _post_deleted(mapper, connection, target):
+    _change_post_count(connection, target.category_id, -1)
+
+
 class Comment(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     body = db.Column(db.Text)
-    created_time = db.Column(db.DateTime, index=True, default=datetime.now())
+    created_time = db.Column(db.DateTime, index=True, default=datetime.utcnow)
+    updated_time = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     author_id = db.Column(db.Integer, db.ForeignKey('user.id'))
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
 
+    __table_args__ = (db.Index('ix_comment_post_id_created_time', 'post_id', 'created_time'),)
+
+    @classmethod
+    def eager_query(cls):
+        """
+        comment query loading author and post title in the same round trip
+        """
+        return cls.query.options(joinedload(cls.author), joinedload(cls.post).load_only('title'))
+
     def to_dict(self):
+        author = self.author.to_author_dict()
         return {
             'id': self.id,
             'body': self.body,
             'created_time': str(self.created_time),
-            'author_name': self.author.name,
+            'author_name': author['name'],
             'post': self.post.title,
-            'author_avatar': self.author.avatar(50)
+            'author_avatar': author['avatar']
         }
 
 
+def _change_comment_count(connection, post_id, delta):
+    if post_id is not None:
+        post = Post.__table__
+        connection.execute(post.update().where(post.c.id == post_id)
+                           .values(comment_count=post.c.comment_count + delta))
+
+
+@event.listens_for(Comment, 'after_insert')
+def _comment_inserted(mapper, connection, target):
+    _change_comment_count(connection, target.post_id, 1)
+
+
+@event.listens_for(Comment, 'after_delete')
+def _comment_deleted(mapper, connection, target):
+    _change_comment_count(connection, target.post_id, -1)
+
+
+class IdSequence(db.Model):
+    """
+    next free id of tables whose ids are allocated in blocks, see app.comments.HiLoAllocator
+    """
+    __tablename__ = 'id_sequence'
+    name = db.Column(db.String(64), primary_key=True)
+    next_value = db.Column(db.BigInteger, nullable=False)
+
+
 class Image(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    url = db.Column(db.String(255))
-    post_id = db.Column(db.Integer, db.ForeignKey('post.id'))
+    url = db.Column(db.String(255), index=True)
+    sha256 = db.Column(db.String(64), index=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), index=True)
+
+    def variants(self):
+        """
+        url of every size variant, served by Photo.get once generated
+        """
+        config = current_app.config
+        if self.url.rsplit('.', 1)[-1].lower() not in config['IMAGE_VARIANT_EXTENSIONS']:
+            return {}
+        return {size: '{}?size={}'.format(self.url, size) for size in config['IMAGE_VARIANT_WIDTHS']}
 
     def to_dict(self):
         return {
             'id': self.id,
             'url': self.url,
-            'filename': self.url.split('/')[-1]
+            'filename': self.url.split('/')[-1],
+            'variants': self.variants()
         }
@@ -0,0 +1,46 @@
+"""
+   app.pool
+   Small pool of objects too costly to set up per request
+"""
+
+import os
+import threading
+from contextlib import contextmanager
+
+
+class Pool(object):
+    """
+    Hands out objects made by factory to one caller at a time and keeps up to
+    size of them idle. A threading.local would do under threads, but gevent's
+    monkey patching makes it greenlet local and so a new object per request.
+    Objects made before a fork are never reused by the child.
+    """
+
+    def __init__(self, factory, size=4, close=None):
+        self._factory = factory
+        self._size = size
+        self._close = close
+        self._reset()
+
+    def _reset(self):
+        self._pid = os.getpid()
+        self._lock = threading.Lock()
+        self._idle = []
+
+    @contextmanager
+    def item(self):
+        if self._pid != os.getpid():
+            self._reset()
+        with self._lock:
+            obj = self._idle.pop() if self._idle else None
+        if obj is None:
+            obj = self._factory()
+        try:
+            yield obj
+        finally:
+            with self._lock:
+                if len(self._idle) < self._size:
+                    self._idle.append(obj)
+                    obj = None
+            if obj is not None and self._close is not None:
+                self._close(obj)
@@ -0,0 +1,223 @@
+"""
+   app.popularity
+   Post view counts buffered in process and written behind in batches, and the
+   most viewed posts of a sliding window, shared by the workers through redis
+"""
+
+import threading
+import time
+import uuid
+from collections import deque
+from flask import current_app
+from sqlalchemy import bindparam
+
+
+class ShardedCounter(object):
+    """
+    counts per key, spread over shards picked by thread so request threads
+    rarely wait on the same lock
+    """
+
+    def __init__(self, shards=8):
+        self._shards = [({}, threading.Lock()) for _ in range(shards)]
+
+    def add(self, key, n=1):
+        counts, lock = self._shards[threading.get_ident() % len(self._shards)]
+        with lock:
+            counts[key] = counts.get(key, 0) + n
+
+    def update(self, counts):
+        for key, n in counts.items():
+            self.add(key, n)
+
+    def drain(self):
+        """
+        take the counts gathered so far, leaving every shard empty
+        @return: dict of key to count
+        """
+        total = {}
+        for counts, lock in self._shards:
+            with lock:
+                taken = dict(counts)
+                counts.clear()
+            for key, n in taken.items():
+                total[key] = total.get(key, 0) + n
+        return total
+
+
+class SpaceSaving(object):
+    """
+    space-saving sketch of the heaviest keys. Keeps at most capacity counters,
+    a new key replaces the smallest one and inherits its count, so a count is
+    overestimated by at most the smallest count when it was taken over.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.counts = {}
+
+    def add(self, key, n=1):
+        counts = self.counts
+        if key in counts or len(counts) < self.capacity:
+            counts[key] = counts.get(key, 0) + n
+            return
+        smallest = min(counts, key=counts.get)
+        counts[key] = counts.pop(smallest) + n
+
+
+class SlidingTopK(object):
+    """
+    most counted keys over the last window seconds, kept as one sketch per
+    window / buckets seconds, merged when read
+    """
+
+    def __init__(self, window=3600, buckets=12, capacity=200):
+        self.span = float(window) / buckets
+        self.buckets = buckets
+        self.capacity = capacity
+        self._sketches = deque()
+        self._lock = threading.Lock()
+
+    def _current(self, now):
+        start = now - now % self.span
+        if not self._sketches or self._sketches[-1][0] < start:
+            self._sketches.append((start, SpaceSaving(self.capacity)))
+        while self._sketches[0][0] <= start - self.buckets * self.span:
+            self._sketches.popleft()
+        return self._sketches[-1][1]
+
+    def update(self, counts, now=None):
+        with self._lock:
+            sketch = self._current(time.time() if now is None else now)
+            for key, n in counts.items():
+                sketch.add(key, n)
+
+    def top(self, k, now=None):
+        """
+        @return: list of (key, count) of the k most counted keys, highest first
+        """
+        totals = {}
+        with self._lock:
+            self._current(time.time() if now is None else now)
+            for _, sketch in self._sketches:
+                for key, n in sketch.counts.items():
+                    totals[key] = totals.get(key, 0) + n
+        return sorted(totals.items(), key=lambda item: (-item[1], -item[0]))[:k]
+
+
+class RedisTopK(object):
+    """
+    SlidingTopK kept in redis, one sorted set per bucket fed by the flushes of
+    every worker, so the ranking and its counts cover all of them. A bucket is
+    trimmed to its capacity heaviest keys and expires once out of the window.
+    """
+
+    def __init__(self, client, prefix, window=3600, buckets=12, capacity=200):
+        self.client = client
+        self.prefix = prefix
+        self.span = float(window) / buckets
+        self.buckets = buckets
+        self.capacity = capacity
+
+    def _bucket(self, now):
+        return int((time.time() if now is None else now) // self.span)
+
+    def update(self, counts, now=None):
+        key = '{}{}'.format(self.prefix, self._bucket(now))
+        pipe = self.client.pipeline(transaction=False)
+        for member, n in counts.items():
+            # ZINCRBY takes its arguments in a different order across redis-py versions
+            pipe.execute_command('ZINCRBY', key, n, member)
+        pipe.zremrangebyrank(key, 0, -self.capacity - 1)
+        pipe.expire(key, int(self.span * (self.buckets + 1)))
+        pipe.execute()
+
+    def top(self, k, now=None):
+        """
+        @return: list of (key, count) of the k most counted keys, highest first
+        """
+        current = self._bucket(now)
+        keys = ['{}{}'.format(self.prefix, bucket) for bucket in range(current - self.buckets + 1, current + 1)]
+        merged = '{}merged:{}'.format(self.prefix, uuid.uuid4().hex)
+        pipe = self.client.pipeline(transaction=False)
+        pipe.zunionstore(merged, keys)
+        pipe.zrevrange(merged, 0, -1, withscores=True)
+        pipe.delete(merged)
+        rows = pipe.execute()[1]
+        totals = [(int(member), int(score)) for member, score in rows]
+        return sorted(totals, key=lambda item: (-item[1], -item[0]))[:k]
+
+
+class ViewCounter(object):
+    """
+    flask extension counting post views in process. A background job adds them
+    to post.views in one executemany every VIEW_FLUSH_INTERVAL seconds and feeds
+    the sliding window the popular posts are ranked from. With the redis cache
+    the window lives in redis and counts the views of every worker, otherwise
+    it only counts those of its process.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        from app import background
+        app.config.setdefault('VIEW_FLUSH_INTERVAL', 5)
+        app.config.setdefault('VIEW_COUNTER_SHARDS', 8)
+        app.config.setdefault('POPULAR_WINDOW', 3600)
+        app.config.setdefault('POPULAR_BUCKETS', 12)
+        app.config.setdefault('POPULAR_CAPACITY', 200)
+        app.config.setdefault('POPULAR_REDIS', app.config.get('CACHE_TYPE') == 'redis')
+        window = (app.config['POPULAR_WINDOW'], app.config['POPULAR_BUCKETS'], app.config['POPULAR_CAPACITY'])
+        if app.config['POPULAR_REDIS']:
+            import redis
+            client = redis.StrictRedis.from_url(app.config['CACHE_REDIS_URL'])
+            top = RedisTopK(client, app.config.get('CACHE_KEY_PREFIX', '') + 'popular:', *window)
+        else:
+            top = SlidingTopK(*window)
+        app.extensions['views'] = {
+            'counts': ShardedCounter(app.config['VIEW_COUNTER_SHARDS']),
+            'top': top,
+            'job': background.add_job(app, 'views', self.flush, app.config['VIEW_FLUSH_INTERVAL']),
+        }
+
+    @property
+    def _state(self):
+        return current_app.extensions['views']
+
+    def hit(self, post_id):
+        state = self._state
+        state['counts'].add(post_id)
+        state['job'].start()
+
+    def flush(self):
+        """
+        write the buffered views, they are put back when the write fails
+        @return: number of posts updated
+        """
+        from app import db
+        from app.models import Post
+        state = self._state
+        counts = state['counts'].drain()
+        if not counts:
+            return 0
+        post = Post.__table__
+        # updated_time is kept, a view does not modify the post
+        statement = post.update().where(post.c.id == bindparam('post_id')) \
+            .values(views=post.c.views + bindparam('n'), updated_time=post.c.updated_time)
+        try:
+            db.session.execute(statement, [{'post_id': post_id, 'n': n} for post_id, n in sorted(counts.items())])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            state['counts'].update(counts)
+            raise
+        state['top'].update(counts)
+        return len(counts)
+
+    def popular(self, k):
+        """
+        @return: list of (post_id, views in the window) of the k most viewed posts
+        """
+        return self._state['top'].top(k)
@@ -1,4 +1,4 @@
-from flask_restful import reqparse
+from flask_restful import reqparse, inputs
 
 # session args
 session_args = reqparse.RequestParser()
@@ -19,6 +19,32 @@ article_args.add_argument('img_id', type=int)
 article_args.add_argument('category', type=str, required=True)
 article_args.add_argument('body', type=str, required=True)
 
+# article list args
+article_list_args = reqparse.RequestParser()
+article_list_args.add_argument('limit', type=int, location='args')
+article_list_args.add_argument('cursor', type=str, location='args')
+article_list_args.add_argument('count', type=inputs.boolean, default=True, location='args')
+
+# category post list args
+category_post_list_args = reqparse.RequestParser()
+category_post_list_args.add_argument('limit', type=int, location='args')
+category_post_list_args.add_argument('cursor', type=str, location='args')
+
+# popular post list args
+popular_args = reqparse.RequestParser()
+popular_args.add_argument('limit', type=int, location='args')
+
+# search args
+search_args = reqparse.RequestParser()
+search_args.add_argument('q', type=str, required=True, location='args')
+search_args.add_argument('limit', type=int, location='args')
+search_args.add_argument('offset', type=int, default=0, location='args')
+
+# comment list args
+comment_list_args = reqparse.RequestParser()
+comment_list_args.add_argument('limit', type=int, location='args')
+comment_list_args.add_argument('cursor', type=str, location='args')
+
 # comment args
 comment_args = reqparse.RequestParser()
 comment_args.add_argument('body', type=str, required=True)
@@ -0,0 +1,68 @@
+"""
+   app.resources.conditional
+   ETag / Last-Modified validators and 304 responses for GET resources
+"""
+
+import hashlib
+from functools import wraps
+from flask import request, current_app
+from flask_restful.utils import unpack
+from werkzeug.http import http_date, quote_etag
+from werkzeug.wrappers import Response as ResponseBase
+
+
+def make_etag(*parts):
+    """
+    strong etag built from the parts identifying a representation
+    """
+    return hashlib.md5(':'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def not_modified(etag, last_modified):
+    """
+    evaluate If-None-Match with the weak comparison, compressed responses carry
+    the weak form of etag, falling back to If-Modified-Since
+    """
+    if request.if_none_match:
+        return request.if_none_match.contains_weak(etag)
+    since = request.if_modified_since
+    if since is None or last_modified is None:
+        return False
+    if since.tzinfo is not None:
+        since = since.replace(tzinfo=None) - since.utcoffset()
+    return last_modified.replace(microsecond=0) <= since
+
+
+def validator_headers(etag, last_modified):
+    headers = {'ETag': quote_etag(etag), 'Cache-Control': 'no-cache'}
+    if last_modified is not None:
+        headers['Last-Modified'] = http_date(last_modified)
+    return headers
+
+
+def conditional(validators):
+    """
+    answer conditional GETs before the resource method runs
+    @param: validators, called with the view arguments, returns (etag, last_modified)
+            or None when the resource does not exist
+    """
+    def decorator(f):
+        @wraps(f)
+        def wrapper(resource, *args, **kwargs):
+            rv = validators(*args, **kwargs)
+            if rv is None:
+                return f(resource, *args, **kwargs)
+            etag, last_modified = rv
+            headers = validator_headers(etag, last_modified)
+            if not_modified(etag, last_modified):
+                return current_app.response_class(status=304, headers=headers)
+
+            resp = f(resource, *args, **kwargs)
+            if isinstance(resp, ResponseBase):
+                resp.headers.extend(headers)
+                return resp
+            data, code, extra_headers = unpack(resp)
+            headers.update(extra_headers or {})
+            return data, code, headers
+        return wrapper
+    return decorator
@@ -22,6 +22,7 @@ img_fields = {
     'id': fields.Integer,
     'url': fields.String,
     'filename': fields.String,
+    'variants': fields.Raw,
 }
 
 article_fields = {
@@ -33,12 +34,54 @@ article_fields = {
     'img': fields.Nested(img_fields),
     'created_time': fields.String,
     'author': fields.String,
-    'author_avatar': fields.String
+    'author_avatar': fields.String,
+    'comment_count': fields.Integer
+}
+
+article_summary_fields = {
+    'id': fields.Integer,
+    'title': fields.String,
+    'category': fields.String,
+    'desc': fields.String,
+    'img': fields.Nested(img_fields),
+    'created_time': fields.String,
+    'author': fields.String,
+    'author_avatar': fields.String,
+    'comment_count': fields.Integer
 }
 
 article_list_fields = {
+    'count': fields.Integer(default=None),
+    'next_cursor': fields.String,
+    'posts': fields.List(fields.Nested(article_summary_fields))
+}
+
+category_fields = {
+    'id': fields.Integer,
+    'name': fields.String,
+    'post_count': fields.Integer
+}
+
+category_list_fields = {
+    'categories': fields.List(fields.Nested(category_fields))
+}
+
+category_post_list_fields = {
     'count': fields.Integer,
-    'posts': fields.List(fields.Nested(article_fields))
+    'next_cursor': fields.String,
+    'posts': fields.List(fields.Nested(article_summary_fields))
+}
+
+popular_post_fields = dict(article_summary_fields, views=fields.Integer, recent_views=fields.Integer)
+
+popular_list_fields = {
+    'posts': fields.List(fields.Nested(popular_post_fields))
+}
+
+search_result_fields = dict(article_summary_fields, snippet=fields.String)
+
+search_list_fields = {
+    'results': fields.List(fields.Nested(search_result_fields))
 }
 
 comment_fields = {
@@ -49,3 +92,9 @@ comment_fields = {
     'post': fields.String,
     'author_avatar': fields.String
 }
+
+comment_list_fields = {
+    'count': fields.Integer,
+    'next_cursor': fields.String,
+    'comments': fields.List(fields.Nested(comment_fields))
+}
@@ -0,0 +1,53 @@
+"""
+   app.resources.pagination
+   Keyset (cursor) pagination over (created_time, id)
+"""
+
+import base64
+from datetime import datetime
+from flask import current_app
+from .errors import BadRequest
+
+CURSOR_TIME_FORMAT = '%Y-%m-%d %H:%M:%S.%f'
+
+
+def encode_cursor(created_time, item_id):
+    raw = '{}|{}'.format(created_time.strftime(CURSOR_TIME_FORMAT), item_id)
+    return base64.urlsafe_b64encode(raw.encode('utf-8')).decode('ascii')
+
+
+def decode_cursor(cursor):
+    try:
+        raw = base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        created_time, item_id = raw.split('|')
+        return datetime.strptime(created_time, CURSOR_TIME_FORMAT), int(item_id)
+    except (ValueError, TypeError, UnicodeError):
+        raise BadRequest
+
+
+def page_size(limit):
+    """
+    clamp the requested page size to [1, MAX_PAGE_SIZE]
+    """
+    if not limit:
+        return current_app.config['PAGE_SIZE']
+    return max(1, min(limit, current_app.config['MAX_PAGE_SIZE']))
+
+
+def paginate(query, time_column, id_column, limit, cursor=None):
+    """
+    return one page of query, newest first, and the cursor of the next page
+    @param: query, time_column, id_column, limit, cursor
+    """
+    if cursor:
+        created_time, item_id = decode_cursor(cursor)
+        # the redundant <= lets MySQL use a range scan on the time index
+        query = query.filter(time_column <= created_time,
+                             (time_column < created_time) | (id_column < item_id))
+    items = query.order_by(time_column.desc(), id_column.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(items) > limit:
+        items = items[:limit]
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, time_column.key), getattr(last, id_column.key))
+    return items, next_cursor
@@ -0,0 +1,166 @@
+"""
+   app.resources.serializers
+   Serializers compiled from the flask_restful field specs in output.py, with
+   the output of marshal, and json encoding with orjson when it is installed
+"""
+
+import json
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, make_response
+from flask_restful import fields
+from flask_restful.fields import get_value, is_indexable_but_not_string
+from flask_restful.utils import unpack
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# fields whose format is a single builtin call, others are output by the field itself
+FORMATS = {fields.String: 'str', fields.Integer: 'int', fields.Boolean: 'bool', fields.Raw: ''}
+
+_compiled = {}
+
+
+def _none(key):
+    return None
+
+
+def _getter(obj):
+    """
+    key -> value function for obj, with the lookup rules of flask_restful.fields.get_value
+    """
+    if type(obj) in (dict, OrderedDict):
+        return obj.get
+    if obj is None:
+        return _none
+    if is_indexable_but_not_string(obj):
+        return lambda key: get_value(key, obj)
+    return lambda key: getattr(obj, key, None)
+
+
+def _make(field):
+    return field() if isinstance(field, type) else field
+
+
+def _plain_key(key):
+    # keys that obj.get or getattr look up the way get_value does
+    return isinstance(key, str) and '.' not in key and not hasattr(dict, key)
+
+
+def _compile_field(key, field, namespace, lines):
+    n = len(namespace)
+    if isinstance(field, dict):
+        namespace['s{}'.format(n)] = compile_fields(field)
+        lines.append('    out[{!r}] = s{}(obj)'.format(key, n))
+        return
+    field = _make(field)
+    namespace['f{}'.format(n)] = field
+    namespace['d{}'.format(n)] = field.default
+    source = key if field.attribute is None else field.attribute
+    if not _plain_key(source):
+        lines.append('    out[{!r}] = f{}.output({!r}, obj)'.format(key, n, key))
+        return
+    lines.append('    v = get({!r})'.format(source))
+
+    if type(field) in FORMATS:
+        lines.append('    out[{!r}] = d{} if v is None else {}(v)'.format(key, n, FORMATS[type(field)]))
+    elif type(field) is fields.Nested:
+        namespace['s{}'.format(n)] = compile_fields(field.nested)
+        lines.append('    if v is None and f{0}.allow_null:\n'
+                     '        out[{1!r}] = None\n'
+                     '    elif v is None and d{0} is not None:\n'
+                     '        out[{1!r}] = d{0}\n'
+                     '    else:\n'
+                     '        out[{1!r}] = s{0}(v)'.format(n, key))
+    elif type(field) is fields.List and type(field.container) is fields.Nested:
+        namespace['i{}'.format(n)] = _compile_field_function(field.container)
+        lines.append('    if isinstance(v, (list, tuple)):\n'
+                     '        out[{1!r}] = [i{0}(item) for item in v]\n'
+                     '    elif v is None:\n'
+                     '        out[{1!r}] = d{0}\n'
+                     '    else:\n'
+                     '        out[{1!r}] = f{0}.output({1!r}, obj)'.format(n, key))
+    else:
+        lines.append('    out[{!r}] = f{}.output({!r}, obj)'.format(key, n, key))
+
+
+def _compile_field_function(field):
+    """
+    item -> output of field for one item of a list, as List.format calls Nested.output
+    """
+    nested = compile_fields(field.nested)
+
+    def output(item):
+        if item is None:
+            if field.allow_null:
+                return None
+            if field.default is not None:
+                return field.default
+        return nested(item)
+    return output
+
+
+def compile_fields(spec):
+    """
+    compile a field spec to a function returning what marshal(obj, spec) returns,
+    as a plain dict. Compiled once per spec and reused.
+    @param: spec, dict of key to field as in output.py
+    """
+    compiled = _compiled.get(id(spec))
+    if compiled is not None and compiled[0] is spec:
+        return compiled[1]
+
+    namespace = {'_getter': _getter}
+    lines = ['def serialize(obj):',
+             '    if isinstance(obj, (list, tuple)):',
+             '        return [serialize(item) for item in obj]',
+             '    get = _getter(obj)',
+             '    out = {}']
+    for key, field in spec.items():
+        _compile_field(key, field, namespace, lines)
+    lines.append('    return out')
+    exec(compile('\n'.join(lines), '<serializer>', 'exec'), namespace)
+    serialize = namespace['serialize']
+    _compiled[id(spec)] = (spec, serialize)
+    return serialize
+
+
+class serialize_with(object):
+    """
+    drop-in replacement of flask_restful.marshal_with using the compiled serializer of spec
+    """
+
+    def __init__(self, spec):
+        self.serialize = compile_fields(spec)
+
+    def __call__(self, f):
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            resp = f(*args, **kwargs)
+            if isinstance(resp, tuple):
+                data, code, headers = unpack(resp)
+                return self.serialize(data), code, headers
+            return self.serialize(resp)
+        return wrapper
+
+
+def dumps(data):
+    """
+    encode data as json bytes with orjson, or with json and the RESTFUL_JSON settings
+    when orjson is not installed or the app runs in debug mode
+    """
+    settings = current_app.config.get('RESTFUL_JSON', {})
+    if orjson is not None and not settings and not current_app.debug:
+        return orjson.dumps(data) + b'\n'
+    settings = dict(settings)
+    if current_app.debug:
+        settings.setdefault('indent', 4)
+    return (json.dumps(data, **settings) + '\n').encode('utf-8')
+
+
+def output_json(data, code, headers=None):
+    resp = make_response(dumps(data), code)
+    resp.headers.extend(headers or {})
+    return resp
@@ -5,22 +5,164 @@
 """
 
 import os
-from flask import request, url_for, send_from_directory, current_app, jsonify
-from sqlalchemy import extract, func, desc 
-from flask_restful import Resource, Api, marshal_with
+import re
+import sqlite3
+import tempfile
+import mimetypes
+from functools import wraps
+from datetime import datetime
+from itertools import groupby
+from flask import request, url_for, send_from_directory, send_file, current_app, jsonify, safe_join
+from sqlalchemy import desc, func
+from sqlalchemy.orm import defer, joinedload
+from flask_restful import Resource, Api
 from flask_security.decorators import login_required, roles_required
 from flask_security.core import current_user
 from flask_security.utils import verify_password, logout_user, hash_password, login_user
-from werkzeug.utils import secure_filename
 from app.models import User, Post, Category, Comment, Image
-from app import db, user_datastore
+from app import db, user_datastore, cache, thumbnailer, search, metrics, view_counter, comment_queue
+from app.comments import QueueFull, comments_written
+from app.uploads import remove_image_file
+from app.thumbnails import variant_filename
 from . import api
-from .errors import errors, ResourceNotFound, PasswordWrongError, Conflict
-from .args import session_args, user_args, article_args, comment_args
+from .errors import errors, BadRequest, ResourceNotFound, PasswordWrongError, Conflict, ServiceUnavailable
+from .args import session_args, user_args, article_args, article_list_args, comment_args, comment_list_args, \
+    category_post_list_args, popular_args, search_args
 from .output import session_fields, user_fields, user_list_fields, img_fields, article_list_fields, article_fields, \
-    comment_fields
+    comment_fields, comment_list_fields, category_list_fields, category_post_list_fields, popular_list_fields, \
+    search_list_fields
+from .pagination import paginate, page_size
+from .conditional import conditional, make_etag
+from .serializers import serialize_with, output_json
 
 resources = Api(api, errors=errors)
+resources.representation('application/json')(output_json)
+
+
+def post_count():
+    """
+    total number of posts, cached for POST_COUNT_CACHE_TIMEOUT seconds
+    """
+    return cache.get_or_set('posts:count', Post.query.count, current_app.config['POST_COUNT_CACHE_TIMEOUT'])
+
+
+def touch(*names):
+    """
+    record that what the names cover changed now, the Last-Modified of their resources
+    """
+    now = datetime.utcnow()
+    for name in names:
+        cache.set('changed:{}'.format(name), now, 0)
+
+
+def last_changed(name, *times):
+    """
+    the latest of times and of the last change of name, taken as now when the
+    cache forgot it, so a client is never told a date older than a change
+    """
+    changed = cache.get_or_set('changed:{}'.format(name), datetime.utcnow, 0)
+    return max(t for t in times + (changed,) if t)
+
+
+def invalidate_posts(*post_ids):
+    """
+    drop the cached post lists and archive, and the given posts with their comments
+    @param: post_ids
+    """
+    touch('posts', *['post:{}'.format(post_id) for post_id in post_ids])
+    keys = ['posts:count', 'archive', 'validators:archive']
+    for post_id in post_ids:
+        keys.append('post:{}'.format(post_id))
+        keys.append('validators:post:{}'.format(post_id))
+    cache.delete(*keys)
+    cache.bump('posts')
+    for post_id in post_ids:
+        invalidate_comments(post_id)
+
+
+def invalidate_comments(post_id):
+    touch('comments:{}'.format(post_id))
+    cache.delete('validators:comments:{}'.format(post_id))
+    cache.bump('comments:{}'.format(post_id))
+
+
+def post_validators(post_id):
+    def load():
+        row = db.session.query(Post.updated_time, Post.comment_count).filter_by(id=post_id).first()
+        if row is None:
+            return None
+        updated_time, comment_count = row
+        # comment_count changes without updated_time
+        return make_etag('post', post_id, updated_time, comment_count), \
+            last_changed('post:{}'.format(post_id), updated_time)
+
+    return cache.get_or_set('validators:post:{}'.format(post_id), load)
+
+
+def post_list_validators():
+    def load():
+        updated_time, count, comment_count = db.session.query(
+            func.max(Post.updated_time), func.count(Post.id), func.sum(Post.comment_count)).one()
+        # a deleted post or a new comment changes the list but not max(updated_time)
+        return updated_time, count, comment_count, last_changed('posts', updated_time)
+
+    key = 'validators:posts:{}'.format(cache.version('posts'))
+    updated_time, count, comment_count, last_modified = cache.get_or_set(key, load)
+    return make_etag('posts', updated_time, count, comment_count, request.query_string), last_modified
+
+
+def comment_list_validators(article_id):
+    def load():
+        row = db.session.query(Post.updated_time, Post.comment_count).filter_by(id=article_id).first()
+        if row is None:
+            return None
+        post_updated, count = row
+        # answered from the (post_id, created_time) index
+        newest = db.session.query(func.max(Comment.created_time)).filter(Comment.post_id == article_id).scalar()
+        # queued comments are written after their created_time
+        last_modified = last_changed('comments:{}'.format(article_id), post_updated, newest)
+        return make_etag('comments', article_id, post_updated, newest, count), last_modified
+
+    validators = cache.get_or_set('validators:comments:{}'.format(article_id), load)
+    if validators is None:
+        return None
+    etag, last_modified = validators
+    return make_etag(etag, request.query_string), last_modified
+
+
+def archive_validators():
+    def load():
+        updated_time, count = db.session.query(func.max(Post.updated_time), func.count(Post.id)).one()
+        return make_etag('archive', updated_time, count), last_changed('posts', updated_time)
+
+    return cache.get_or_set('validators:archive', load)
+
+
+def post_dict(post_id):
+    """
+    the cached representation of a post, ResourceNotFound if there is none
+    """
+    def load():
+        post = Post.eager_query().filter_by(id=post_id).first()
+        if not post:
+            raise ResourceNotFound
+        return post.to_dict()
+
+    return cache.get_or_set('post:{}'.format(post_id), load)
+
+
+@comments_written.connect
+def comments_changed(sender, post_ids):
+    """
+    drop what showed the comments or comment_count of the posts
+    """
+    touch('posts', *['post:{}'.format(post_id) for post_id in post_ids])
+    keys = []
+    for post_id in post_ids:
+        invalidate_comments(post_id)
+        keys.extend(['post:{}'.format(post_id), 'validators:post:{}'.format(post_id)])
+    cache.delete(*keys)
+    cache.bump('posts')
 
 
 class Session(Resource):
@@ -28,13 +170,13 @@ class Session(Resource):
     This class is used to manage session state
     """
 
-    @marshal_with(session_fields)
+    @serialize_with(session_fields)
     def post(self):
         """
         This method is used to login
         """
         args = session_args.parse_args()
-        user = User.query.filter_by(email=args['email']).first()
+        user = User.query.options(joinedload(User.roles)).filter_by(email=args['email']).first()
         if not user:
             raise ResourceNotFound
 
@@ -57,7 +199,7 @@ class Session(Resource):
 
 class UserList(Resource):
 
-    @marshal_with(user_fields)
+    @serialize_with(user_fields)
     def post(self):
         """
         register
@@ -73,28 +215,38 @@ class UserList(Resource):
             raise Conflict
 
     @roles_required('admin')
-    @marshal_with(user_list_fields)
+    @serialize_with(user_list_fields)
     def get(self):
         users = User.query.order_by(User.id.desc()).all()
         count = User.query.count()
         return {'users': users, 'count': count}
 
 
+def counts_view(f):
+    """
+    count a view of the post once f answered it, with a body or a 304
+    """
+    @wraps(f)
+    def wrapper(resource, post_id):
+        resp = f(resource, post_id)
+        view_counter.hit(post_id)
+        return resp
+    return wrapper
+
+
 class Article(Resource):
-    @marshal_with(article_fields)
+    @counts_view
+    @conditional(post_validators)
+    @serialize_with(article_fields)
     def get(self, post_id):
         """
         return a post
         @param: post_id
         """
-        post = Post.query.filter_by(id=post_id).first()
-        if not post:
-            raise ResourceNotFound
-
-        return post.to_dict()
+        return post_dict(post_id)
 
     @roles_required('admin')
-    @marshal_with(article_fields)
+    @serialize_with(article_fields)
     def put(self, post_id):
         """
         modify post
@@ -108,7 +260,7 @@ class Article(Resource):
         post.title = args['title']
         img_id = args['img_id']
         category = Category.query.filter_by(name=args['category']).first()
-        img = Image.query.filter_by(id=img_id).first()
+        img = Image.query.get(img_id) if img_id is not None else None
         if not category:
             category = Category(name=args['category'])
         try:
@@ -116,11 +268,15 @@ class Article(Resource):
             post.img = img
             post.body = request.json['body']
             post.description = request.json['desc']
+            post.render_body()
+            post.updated_time = datetime.utcnow()
             db.session.add(post)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise Conflict
+        invalidate_posts(post.id)
+        search.safe('index', post)
         return post.to_dict()
 
     @roles_required('admin')
@@ -132,71 +288,197 @@ class Article(Resource):
         post = Post.query.filter_by(id=post_id).first()
         img = post.img
         if img:
-            path = os.path.join(current_app.config['UPLOAD_FOLDER'], img.url.split('/')[-1])
-            if os.path.exists(path):
-                os.remove(path)
+            if not Image.query.filter(Image.url == img.url, Image.id != img.id).first():
+                remove_image_file(img.url)
             db.session.delete(img)
         db.session.delete(post)
         db.session.commit()
+        invalidate_posts(post_id)
+        search.safe('remove', post_id)
         return "", 201
 
 
 class ArticleList(Resource):
     @roles_required('admin')
-    @marshal_with(article_fields)
+    @serialize_with(article_fields)
     def post(self):
         """
         Add new post
         """
         args = article_args.parse_args()
-        img = Image.query.filter_by(id=args['img_id']).first()
+        img = Image.query.get(args['img_id']) if args['img_id'] is not None else None
         category = Category.query.filter_by(name=args['category']).first()
         if not category:
             category = Category(name=args['category'])
         p = Post(title=args['title'], description=args['desc'], category=category, body=args['body'], author=current_user,
                  img=img)
+        p.render_body()
         try:
             db.session.add(p)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise Conflict
+        invalidate_posts()
+        search.safe('index', p)
         return p.to_dict()
 
-    @marshal_with(article_list_fields)
+    @conditional(post_list_validators)
+    @serialize_with(article_list_fields)
     def get(self):
-        posts = Post.query.order_by(Post.created_time.desc()).all()
-        count = Post.query.count()
-        return {'count': count, 'posts': [p.to_dict() for p in posts]}
+        """
+        return a page of posts without their body, newest first
+        @param: limit, cursor, count
+        """
+        args = article_list_args.parse_args()
+        limit = page_size(args['limit'])
+
+        def load():
+            query = Post.eager_query().options(defer(Post.body), defer(Post.body_html))
+            posts, next_cursor = paginate(query, Post.created_time, Post.id, limit, args['cursor'])
+            return {'count': post_count() if args['count'] else None,
+                    'next_cursor': next_cursor,
+                    'posts': [p.to_summary_dict() for p in posts]}
+
+        key = 'posts:{}:{}:{}:{}'.format(cache.version('posts'), limit, args['cursor'], args['count'])
+        return cache.get_or_set(key, load)
+
+
+class PopularPostList(Resource):
+
+    @serialize_with(popular_list_fields)
+    def get(self):
+        """
+        most viewed posts of the last POPULAR_WINDOW seconds, padded with the most
+        viewed of all time, without their body
+        @param: limit
+        """
+        limit = page_size(popular_args.parse_args()['limit'])
+        ranked = view_counter.popular(limit)
+        recent = dict(ranked)
+        post_ids = [post_id for post_id, _ in ranked]
+        if len(post_ids) < limit:
+            # read from the views index, never the whole table
+            top = db.session.query(Post.id).order_by(desc(Post.views), desc(Post.id)).limit(limit)
+            post_ids += [post_id for post_id, in top if post_id not in recent][:limit - len(post_ids)]
+        posts = Post.eager_query().options(defer(Post.body), defer(Post.body_html)) \
+            .filter(Post.id.in_(post_ids)).all() if post_ids else []
+        posts = {post.id: post for post in posts}
+        results = []
+        for post_id in post_ids:
+            if post_id in posts:
+                data = posts[post_id].to_summary_dict()
+                data['views'] = posts[post_id].views
+                data['recent_views'] = recent.get(post_id, 0)
+                results.append(data)
+        return {'posts': results}
 
 
 class CommentList(Resource):
     @login_required
-    @marshal_with(comment_fields)
+    @serialize_with(comment_fields)
     def post(self, article_id):
         """
         Add new comment
         """
         args = comment_args.parse_args()
         user = current_user
+        if current_app.config['COMMENT_QUEUE_ENABLED']:
+            return self.enqueue(args['body'], post_dict(article_id), user)
         post = Post.query.filter_by(id=article_id).first()
-        comment = Comment(body=args['body'], post=post, author=user)
+        if not post:
+            raise ResourceNotFound
+        comment = Comment(id=comment_queue.next_id(), body=args['body'], post=post, author=user)
         try:
+            # the insert also increments post.comment_count, in the same transaction
             db.session.add(comment)
             db.session.commit()
         except Exception as e:
             db.session.rollback()
             raise Conflict
+        comments_changed(current_app, [article_id])
         return comment.to_dict()
 
-    @marshal_with(comment_fields)
+    @staticmethod
+    def enqueue(body, post, user):
+        """
+        accept the comment for the batch writer, it is listed once written
+        """
+        try:
+            row = comment_queue.put(body, post['id'], user.id)
+        except QueueFull:
+            raise ServiceUnavailable
+        author = user.to_author_dict()
+        return {'id': row['id'],
+                'body': row['body'],
+                'created_time': str(row['created_time']),
+                'author_name': author['name'],
+                'post': post['title'],
+                'author_avatar': author['avatar']}, 202
+
+    @conditional(comment_list_validators)
+    @serialize_with(comment_list_fields)
     def get(self, article_id):
         """
-        return comment list by article id
+        return a page of the comments of a post, newest first
+        @param: limit, cursor
         """
-        post = Post.query.filter_by(id=article_id).first()
-        comments = post.comments.all()
-        return [c.to_dict() for c in comments[::-1]]
+        args = comment_list_args.parse_args()
+        limit = page_size(args['limit'])
+
+        def load():
+            count = db.session.query(Post.comment_count).filter_by(id=article_id).scalar()
+            if count is None:
+                raise ResourceNotFound
+            query = Comment.eager_query().filter_by(post_id=article_id)
+            comments, next_cursor = paginate(query, Comment.created_time, Comment.id, limit, args['cursor'])
+            return {'count': count,
+                    'next_cursor': next_cursor,
+                    'comments': [c.to_dict() for c in comments]}
+
+        key = 'comments:{}:{}:{}:{}'.format(article_id, cache.version('comments:{}'.format(article_id)),
+                                            limit, args['cursor'])
+        return cache.get_or_set(key, load)
+
+
+class CategoryList(Resource):
+
+    @serialize_with(category_list_fields)
+    def get(self):
+        """
+        every category with its number of posts, for the sidebar
+        """
+        def load():
+            return {'categories': [c.to_dict() for c in Category.query.order_by(Category.name)]}
+
+        return cache.get_or_set('categories:{}'.format(cache.version('posts')), load)
+
+
+class CategoryPostList(Resource):
+
+    @serialize_with(category_post_list_fields)
+    def get(self, category_id):
+        """
+        return a page of the posts of a category without their body, newest first
+        @param: limit, cursor
+        """
+        args = category_post_list_args.parse_args()
+        limit = page_size(args['limit'])
+
+        def load():
+            count = db.session.query(Category.post_count).filter_by(id=category_id).scalar()
+            if count is None:
+                raise ResourceNotFound
+            # served by the (category_id, created_time) index
+            query = Post.eager_query().options(defer(Post.body), defer(Post.body_html)) \
+                .filter(Post.category_id == category_id)
+            posts, next_cursor = paginate(query, Post.created_time, Post.id, limit, args['cursor'])
+            return {'count': count,
+                    'next_cursor': next_cursor,
+                    'posts': [p.to_summary_dict() for p in posts]}
+
+        key = 'category:{}:{}:{}:{}'.format(category_id, cache.version('posts'), limit, args['cursor'])
+        return cache.get_or_set(key, load)
 
 
 class PhotoList(Resource):
@@ -211,70 +493,210 @@ class PhotoList(Resource):
                filename.rsplit('.', 1)[1] in current_app.config['ALLOWED_EXTENSIONS']
 
     @roles_required('admin')
-    @marshal_with(img_fields)
+    @serialize_with(img_fields)
     def post(self):
         """
-        add photo
+        add photo, stored once under the sha256 of its content
         """
-        file = request.files['file']
-        if file and self.allowed_file(file.filename):
-            filename = secure_filename(file.filename)
-            if not os.path.exists(current_app.config['UPLOAD_FOLDER']):
-                os.makedirs(current_app.config['UPLOAD_FOLDER'])
-            file.save(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-            img_url = url_for('api.photo', filename=filename)
-            img = Image(url=img_url)
-            db.session.add(img)
-            db.session.commit()
-            return img.to_dict()
-        else:
+        file = request.files.get('file')
+        if not file or not self.allowed_file(file.filename):
             raise Conflict
 
+        sha256 = file.stream.hexdigest()
+        images = Image.query.filter_by(sha256=sha256).all()
+        for img in images:
+            if img.post_id is None:
+                return img.to_dict()
+
+        if images:
+            # the content is already on disk but every copy belongs to a post
+            img_url = images[0].url
+        else:
+            filename = '{}.{}'.format(sha256, file.filename.rsplit('.', 1)[1].lower())
+            path = os.path.join(current_app.config['UPLOAD_FOLDER'], filename)
+            file.stream.persist(path)
+            thumbnailer.submit(path)
+            img_url = url_for('api.photo', filename=filename)
+        img = Image(url=img_url, sha256=sha256)
+        db.session.add(img)
+        db.session.commit()
+        return img.to_dict()
+
 
 class Photo(Resource):
+    # uploads are named after the sha256 of their content, so their urls never change content
+    content_addressed = re.compile(r'^[0-9a-f]{64}\.\w+$')
+
+    @staticmethod
+    def variant(filename, size):
+        """
+        best available variant of filename for size, webp if the client accepts it,
+        falling back to the original while variants are being generated
+        """
+        folder = current_app.config['UPLOAD_FOLDER']
+        if size not in current_app.config['IMAGE_VARIANT_WIDTHS']:
+            return filename
+        candidates = [variant_filename(filename, size)]
+        if request.accept_mimetypes.quality('image/webp'):
+            candidates.insert(0, variant_filename(filename, size, 'webp'))
+        for candidate in candidates:
+            if os.path.exists(os.path.join(folder, candidate)):
+                return candidate
+        return filename
 
     def get(self, filename):
-        return send_from_directory(
-            current_app.config['UPLOAD_FOLDER'], filename)
+        size = request.args.get('size')
+        served = self.variant(filename, size) if size else filename
+        accel_prefix = current_app.config['PHOTO_ACCEL_REDIRECT']
+        if accel_prefix:
+            path = safe_join(current_app.config['UPLOAD_FOLDER'], served)
+            if path is None or not os.path.isfile(path):
+                raise ResourceNotFound
+            # nginx serves the file from its internal location, gunicorn only sends headers
+            response = current_app.response_class(mimetype=mimetypes.guess_type(served)[0])
+            response.headers['X-Accel-Redirect'] = accel_prefix + served
+        else:
+            response = send_from_directory(current_app.config['UPLOAD_FOLDER'], served)
+        if size:
+            response.vary.add('Accept')
+        # a ?size= url falling back to the original will change once the variant exists
+        if self.content_addressed.match(filename) and (not size or served != filename):
+            response.headers['Cache-Control'] = 'public, max-age=31536000, immutable'
+        return response
 
     @roles_required('admin')
     def delete(self, filename):
         img_url = url_for('api.photo', filename=filename)
-        img = Image.query.filter_by(url=img_url).first()
-        if img:
-            os.remove(os.path.join(current_app.config['UPLOAD_FOLDER'], filename))
-            db.session.delete(img)
+        images = Image.query.filter_by(url=img_url).all()
+        if images:
+            remove_image_file(img_url)
+            post_ids = [img.post_id for img in images if img.post_id]
+            if post_ids:
+                Post.query.filter(Post.id.in_(post_ids)) \
+                    .update({Post.updated_time: datetime.utcnow()}, synchronize_session=False)
+            for img in images:
+                db.session.delete(img)
             db.session.commit()
+            if post_ids:
+                invalidate_posts(*post_ids)
             return '', 201
         else:
             raise Conflict
 
 class Archive(Resource):
 
+    @staticmethod
+    def archives():
+        posts = db.session.query(Post.id, Post.title, Post.created_time) \
+            .order_by(desc(Post.created_time), desc(Post.id)).all()
+        data = []
+        for (year, month), group in groupby(posts, key=lambda p: (p.created_time.year, p.created_time.month)):
+            archive_posts = [{'id': post.id, 'title': post.title} for post in group]
+            data.append({
+                'year': year,
+                'month': month,
+                'count': len(archive_posts),
+                'posts': archive_posts,
+            })
+        return data
+
+    @conditional(archive_validators)
     def get(self):
-        archives = db.session.query(extract('year', Post.created_time).label('year'), extract('month', Post.created_time).label('month'), func.count('*').label('count')).group_by('year, month').order_by(desc('year'), desc('month')).all()
-        data = [] 
-        for archive in archives:
-            archive_post = {}
-
-            archive_post["year"] = archive[0]
-            archive_post["month"] = archive[1]
-            archive_post["count"] = archive[2]
-            
-            posts = Post.query.filter(extract('year', Post.created_time)==archive[0], extract('month', Post.created_time)==archive[1]).order_by(desc(Post.created_time)).all()
-            archive_post["posts"] = [{'id': post.id, 'title': post.title} for post in posts]
-            
-            data.append(archive_post)
-            
-            
-        return jsonify(data)
-    
+        """
+        return posts grouped by month, newest first
+        """
+        return jsonify(cache.get_or_set('archive', self.archives))
+
+
+class Search(Resource):
+
+    @serialize_with(search_list_fields)
+    def get(self):
+        """
+        posts matching q, best first, with a highlighted snippet
+        @param: q, limit, offset
+        """
+        args = search_args.parse_args()
+        try:
+            hits = search.search(args['q'], page_size(args['limit']), max(args['offset'], 0))
+        except sqlite3.Error:
+            raise ServiceUnavailable
+        posts = Post.eager_query().options(defer(Post.body), defer(Post.body_html)) \
+            .filter(Post.id.in_([post_id for post_id, _ in hits])).all() if hits else []
+        posts = {post.id: post for post in posts}
+        results = []
+        for post_id, snippet in hits:
+            if post_id in posts:
+                data = posts[post_id].to_summary_dict()
+                data['snippet'] = snippet
+                results.append(data)
+        return {'results': results}
+
+
+class CacheStats(Resource):
+
+    @roles_required('admin')
+    def get(self):
+        return cache.stats()
+
+
+class Metrics(Resource):
+
+    @roles_required('admin')
+    def get(self):
+        stats = cache.stats()
+        body = metrics.prometheus([
+            ('blog_cache_hits_total', 'Cache lookups that found a value', 'counter', stats['hits']),
+            ('blog_cache_misses_total', 'Cache lookups that found nothing', 'counter', stats['misses']),
+        ])
+        return current_app.response_class(body, mimetype='text/plain; version=0.0.4')
+
+
+class Export(Resource):
+
+    @roles_required('admin')
+    def get(self):
+        """
+        download posts, comments, users and uploads as a tar.gz, built in a
+        temporary file and streamed from there
+        """
+        from app.transfer import write_archive
+        f = tempfile.TemporaryFile()
+        write_archive(f, current_app.config['TRANSFER_BATCH_SIZE'])
+        f.seek(0)
+        return send_file(f, mimetype='application/gzip', as_attachment=True,
+                         attachment_filename='blog-export-{:%Y%m%d}.tar.gz'.format(datetime.utcnow()))
+
+
+class Import(Resource):
+
+    @roles_required('admin')
+    def post(self):
+        """
+        import an archive sent as the raw request body, read as it arrives
+        """
+        from app.transfer import import_archive, TransferError, NotEmptyError
+        try:
+            return import_archive(request.stream, current_app.config['TRANSFER_BATCH_SIZE'])
+        except NotEmptyError:
+            raise Conflict
+        except TransferError:
+            raise BadRequest
+
 
 resources.add_resource(Session, '/sessions')
 resources.add_resource(UserList, '/users')
-resources.add_resource(Article, '/posts/<post_id>')
+resources.add_resource(Article, '/posts/<int:post_id>')
 resources.add_resource(ArticleList, '/posts')
-resources.add_resource(CommentList, '/comments/<article_id>')
+resources.add_resource(PopularPostList, '/posts/popular')
+resources.add_resource(CommentList, '/comments/<int:article_id>')
+resources.add_resource(CategoryList, '/categories')
+resources.add_resource(CategoryPostList, '/categories/<int:category_id>/posts')
 resources.add_resource(PhotoList, '/photos')
 resources.add_resource(Photo, '/photos/<filename>')
 resources.add_resource(Archive, '/archive')
+resources.add_resource(Search, '/search')
+resources.add_resource(CacheStats, '/cache')
+resources.add_resource(Metrics, '/_metrics')
+resources.add_resource(Export, '/export')
+resources.add_resource(Import, '/import')
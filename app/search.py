@@ -0,0 +1,114 @@
+"""
+   app.search
+   Full-text index of posts in a sqlite FTS5 sidecar database
+"""
+
+import logging
+import os
+import sqlite3
+from flask import current_app
+from app.pool import Pool
+
+logger = logging.getLogger(__name__)
+
+# bm25 weights of the title, description and body columns
+RANK = 'bm25(post_fts, 10.0, 5.0, 1.0)'
+
+
+def match_expression(q):
+    """
+    quote every term so user input can never be parsed as FTS5 query syntax
+    """
+    terms = ['"{}"'.format(term.replace('"', '""')) for term in q.split()]
+    return ' '.join(terms)
+
+
+def open_index(path, tokenizer):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute("CREATE VIRTUAL TABLE IF NOT EXISTS post_fts "
+                 "USING fts5(title, description, body, tokenize='{}')".format(tokenizer))
+    return conn
+
+
+class SearchIndex(object):
+    """
+    Keeps title, description and body of every post in an FTS5 table, updated
+    incrementally by the post write paths. Each process keeps a pool of up to
+    SEARCH_POOL_SIZE connections; WAL mode lets the workers share one file.
+    """
+
+    def init_app(self, app):
+        app.config.setdefault('SEARCH_INDEX_PATH', 'search.sqlite')
+        app.config.setdefault('SEARCH_TOKENIZER', 'unicode61')
+        app.config.setdefault('SEARCH_POOL_SIZE', 4)
+        app.extensions['search'] = Pool(
+            lambda: open_index(app.config['SEARCH_INDEX_PATH'], app.config['SEARCH_TOKENIZER']),
+            app.config['SEARCH_POOL_SIZE'], close=lambda conn: conn.close())
+
+    def _connection(self):
+        return current_app.extensions['search'].item()
+
+    def index(self, post):
+        """
+        add or replace a post in the index
+        """
+        with self._connection() as conn, conn:
+            conn.execute('BEGIN')
+            conn.execute('DELETE FROM post_fts WHERE rowid = ?', (post.id,))
+            conn.execute('INSERT INTO post_fts (rowid, title, description, body) VALUES (?, ?, ?, ?)',
+                         (post.id, post.title, post.description, post.body))
+
+    def remove(self, post_id):
+        with self._connection() as conn, conn:
+            conn.execute('BEGIN')
+            conn.execute('DELETE FROM post_fts WHERE rowid = ?', (post_id,))
+
+    def rebuild(self, posts):
+        """
+        replace the whole index with posts, an iterable of (id, title, description, body)
+        """
+        with self._connection() as conn, conn:
+            conn.execute('BEGIN')
+            conn.execute('DELETE FROM post_fts')
+            conn.executemany('INSERT INTO post_fts (rowid, title, description, body) VALUES (?, ?, ?, ?)', posts)
+            conn.execute("INSERT INTO post_fts (post_fts) VALUES ('optimize')")
+
+    def reindex(self):
+        """
+        rebuild the index from the posts table
+        @return: the number of indexed posts
+        """
+        from app import db
+        from app.models import Post
+        self.rebuild(db.session.query(Post.id, Post.title, Post.description, Post.body).yield_per(1000))
+        return self.count()
+
+    def count(self):
+        with self._connection() as conn:
+            return conn.execute('SELECT count(*) FROM post_fts').fetchone()[0]
+
+    def search(self, q, limit, offset=0):
+        """
+        best matches for q, as a list of (post id, snippet)
+        """
+        expression = match_expression(q)
+        if not expression:
+            return []
+        with self._connection() as conn:
+            return conn.execute(
+                "SELECT rowid, snippet(post_fts, -1, '<mark>', '</mark>', '...', 16) FROM post_fts "
+                "WHERE post_fts MATCH ? ORDER BY {} LIMIT ? OFFSET ?".format(RANK),
+                (expression, limit, offset)).fetchall()
+
+    def safe(self, method, *args):
+        """
+        run an index update without failing the request, `flask reindex` repairs misses
+        """
+        try:
+            getattr(self, method)(*args)
+        except sqlite3.Error as e:
+            logger.warning('search index %s failed: %s', method, e)
@@ -0,0 +1,102 @@
+"""
+   app.thumbnails
+   Resized and webp variants of uploaded images, generated in worker processes
+"""
+
+import logging
+import os
+import threading
+from flask import current_app
+
+logger = logging.getLogger(__name__)
+
+
+def variant_filename(filename, size, fmt=None):
+    """
+    name of the size variant of filename, e.g. <sha256>-small.webp
+    """
+    stem, ext = os.path.splitext(filename)
+    return '{}-{}{}'.format(stem, size, '.' + fmt if fmt else ext)
+
+
+def generate_variants(path, widths):
+    """
+    write a resized copy and a webp copy of path for every width,
+    runs in a worker process
+    @param: path, widths mapping a size name to its maximum width
+    """
+    from PIL import Image
+
+    directory, filename = os.path.split(path)
+    with Image.open(path) as original:
+        original.load()
+        for size, width in widths.items():
+            image = original.copy()
+            if image.width > width:
+                image.thumbnail((width, image.height), Image.LANCZOS)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+            targets = [(variant_filename(filename, size), original.format, {}),
+                       (variant_filename(filename, size, 'webp'), 'WEBP', {'quality': 80})]
+            for name, fmt, options in targets:
+                if fmt == 'JPEG':
+                    image = image.convert('RGB')
+                tmp = os.path.join(directory, '.' + name)
+                image.save(tmp, fmt, **options)
+                os.replace(tmp, os.path.join(directory, name))
+
+
+def remove_variants(path):
+    directory, filename = os.path.split(path)
+    for size in current_app.config['IMAGE_VARIANT_WIDTHS']:
+        for fmt in (None, 'webp'):
+            variant = os.path.join(directory, variant_filename(filename, size, fmt))
+            if os.path.exists(variant):
+                os.remove(variant)
+
+
+def _log_failure(future):
+    if future.exception() is not None:
+        logger.warning('image variant generation failed: %s', future.exception())
+
+
+class Thumbnailer(object):
+    """
+    submits variant generation to a process pool created lazily in each worker,
+    or runs it inline when IMAGE_VARIANT_WORKERS is 0
+    """
+
+    def __init__(self):
+        self._executor = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_VARIANT_WIDTHS', {'small': 320, 'medium': 768, 'large': 1280})
+        app.config.setdefault('IMAGE_VARIANT_EXTENSIONS', set(['png', 'jpg', 'jpeg', 'gif']))
+        app.config.setdefault('IMAGE_VARIANT_WORKERS', 2)
+
+    def _get_executor(self, workers):
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                from concurrent.futures import ProcessPoolExecutor
+                self._executor = ProcessPoolExecutor(max_workers=workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def submit(self, path):
+        """
+        generate the variants of the image at path, if it is an image
+        """
+        config = current_app.config
+        if path.rsplit('.', 1)[-1].lower() not in config['IMAGE_VARIANT_EXTENSIONS']:
+            return
+        widths = dict(config['IMAGE_VARIANT_WIDTHS'])
+        if not config['IMAGE_VARIANT_WORKERS']:
+            try:
+                generate_variants(path, widths)
+            except Exception as e:
+                logger.warning('image variant generation failed: %s', e)
+            return
+        future = self._get_executor(config['IMAGE_VARIANT_WORKERS']).submit(generate_variants, path, widths)
+        future.add_done_callback(_log_failure)
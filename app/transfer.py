@@ -0,0 +1,304 @@
+"""
+   app.transfer
+   Export and import of the blog content as a tar of newline delimited json
+   and uploaded files
+"""
+
+import io
+import json
+import os
+import tarfile
+import tempfile
+import time
+from datetime import datetime
+from flask import current_app
+from sqlalchemy.exc import IntegrityError
+from app import db, cache, search, thumbnailer
+from app.models import User, Role, Post, Category, Comment, Image, roles_users, render_markdown
+
+FORMAT_VERSION = 1
+TIME_FORMATS = ('%Y-%m-%dT%H:%M:%S.%f', '%Y-%m-%dT%H:%M:%S')
+
+# exported columns of each member, members are written and read in this order
+MEMBERS = (
+    ('users', User, ('id', 'name', 'email', 'password', 'active', 'confirmed_at')),
+    ('categories', Category, ('id', 'name')),
+    ('posts', Post, ('id', 'title', 'description', 'body', 'body_html', 'body_hash', 'created_time',
+                     'updated_time', 'author_id', 'category_id', 'views')),
+    ('comments', Comment, ('id', 'body', 'created_time', 'updated_time', 'author_id', 'post_id')),
+    ('images', Image, ('id', 'url', 'sha256', 'post_id')),
+)
+TIME_COLUMNS = ('created_time', 'updated_time', 'confirmed_at')
+
+
+class TransferError(Exception):
+    pass
+
+
+class NotEmptyError(TransferError):
+    pass
+
+
+def _encode(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _decode_time(value):
+    if value is None:
+        return None
+    for fmt in TIME_FORMATS:
+        try:
+            return datetime.strptime(value, fmt)
+        except ValueError:
+            pass
+    raise TransferError('bad timestamp {!r}'.format(value))
+
+
+def _rows(model, columns, batch_size):
+    """
+    rows of model as dicts, read in keyset batches of the primary key
+    """
+    query = db.session.query(*[getattr(model, column) for column in columns])
+    last_id = 0
+    while True:
+        batch = query.filter(model.id > last_id).order_by(model.id).limit(batch_size).all()
+        if not batch:
+            return
+        for row in batch:
+            yield dict((column, _encode(value)) for column, value in zip(columns, row))
+        last_id = batch[-1][0]
+
+
+def _user_roles():
+    roles = {}
+    for user_id, name in db.session.query(roles_users.c.user_id, Role.name).join(
+            Role, Role.id == roles_users.c.role_id):
+        roles.setdefault(user_id, []).append(name)
+    return roles
+
+
+def _add_member(tar, name, fileobj, size):
+    info = tarfile.TarInfo(name)
+    info.size = size
+    info.mtime = time.time()
+    info.mode = 0o644
+    tar.addfile(info, fileobj)
+
+
+def write_archive(fileobj, batch_size=1000):
+    """
+    write the gzipped archive to fileobj. Each member is spooled to a temporary
+    file first, since tar needs its size up front, so memory use does not grow
+    with the number of posts.
+    @return: dict of the number of rows or files written per member
+    """
+    counts = {}
+    with tarfile.open(fileobj=fileobj, mode='w|gz') as tar:
+        manifest = json.dumps({'version': FORMAT_VERSION, 'created': datetime.utcnow().isoformat()}).encode('utf-8')
+        _add_member(tar, 'manifest.json', io.BytesIO(manifest), len(manifest))
+
+        roles = _user_roles()
+        for name, model, columns in MEMBERS:
+            count = 0
+            with tempfile.SpooledTemporaryFile(max_size=8 * 1024 * 1024) as f:
+                for row in _rows(model, columns, batch_size):
+                    if model is User:
+                        row['roles'] = roles.get(row['id'], [])
+                    f.write(json.dumps(row, ensure_ascii=False).encode('utf-8'))
+                    f.write(b'\n')
+                    count += 1
+                size = f.tell()
+                f.seek(0)
+                _add_member(tar, name + '.ndjson', f, size)
+            counts[name] = count
+
+        folder = current_app.config['UPLOAD_FOLDER']
+        filenames = set(os.path.basename(url) for url, in db.session.query(Image.url).distinct())
+        counts['files'] = 0
+        for filename in sorted(filenames):
+            path = os.path.join(folder, filename)
+            if os.path.isfile(path):
+                tar.add(path, 'uploads/' + filename)
+                counts['files'] += 1
+    return counts
+
+
+def _lines(fileobj):
+    for line in fileobj:
+        if line.strip():
+            yield json.loads(line.decode('utf-8'))
+
+
+class Importer(object):
+    """
+    Reads an archive member by member, as tar streams them, and inserts rows in
+    batches of batch_size, committing after each batch, so a failed import
+    leaves the batches before the failure in place. Users and categories
+    are matched to existing rows by email and name. Posts, comments and images
+    keep their ids, so urls of the old blog keep working, which requires the
+    target to have none of them yet.
+    """
+
+    def __init__(self, batch_size=1000):
+        self.batch_size = batch_size
+        self.users = {}
+        self.categories = {}
+        self.counts = dict((name, 0) for name, _, _ in MEMBERS)
+        self.counts['files'] = 0
+
+    def _batched(self, model, name, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= self.batch_size:
+                self._flush(model, name, batch)
+                batch = []
+        self._flush(model, name, batch)
+
+    def _flush(self, model, name, batch):
+        if batch:
+            db.session.execute(model.__table__.insert(), batch)
+            db.session.commit()
+            self.counts[name] += len(batch)
+
+    def import_users(self, rows):
+        existing = dict(db.session.query(User.email, User.id))
+        roles = dict(db.session.query(Role.name, Role.id))
+        created = []
+        for row in rows:
+            if row['email'] in existing:
+                self.users[row['id']] = existing[row['email']]
+                continue
+            user = User(name=row['name'], email=row['email'], password=row['password'],
+                        active=row['active'], confirmed_at=row['confirmed_at'])
+            for role_name in row.get('roles', []):
+                if role_name not in roles:
+                    role = Role(name=role_name)
+                    db.session.add(role)
+                    db.session.flush()
+                    roles[role_name] = role.id
+            db.session.add(user)
+            created.append((row, user))
+            if len(created) >= self.batch_size:
+                self._commit_users(created, roles)
+                created = []
+        self._commit_users(created, roles)
+
+    def _commit_users(self, created, roles):
+        if not created:
+            return
+        db.session.flush()
+        links = []
+        for row, user in created:
+            self.users[row['id']] = user.id
+            links.extend({'user_id': user.id, 'role_id': roles[name]} for name in row.get('roles', []))
+        if links:
+            db.session.execute(roles_users.insert(), links)
+        db.session.commit()
+        self.counts['users'] += len(created)
+
+    def import_categories(self, rows):
+        existing = dict(db.session.query(Category.name, Category.id))
+        for row in rows:
+            if row['name'] not in existing:
+                category = Category(name=row['name'])
+                db.session.add(category)
+                db.session.flush()
+                existing[row['name']] = category.id
+                self.counts['categories'] += 1
+            self.categories[row['id']] = existing[row['name']]
+        db.session.commit()
+
+    def import_posts(self, rows):
+        def convert():
+            for row in rows:
+                row['author_id'] = self.users.get(row['author_id'])
+                row['category_id'] = self.categories.get(row['category_id'])
+                if row['body_html'] is None:
+                    row['body_html'] = render_markdown(row['body'])
+                yield row
+        self._batched(Post, 'posts', convert())
+
+    def import_comments(self, rows):
+        def convert():
+            for row in rows:
+                row['author_id'] = self.users.get(row['author_id'])
+                yield row
+        self._batched(Comment, 'comments', convert())
+
+    def import_images(self, rows):
+        self._batched(Image, 'images', rows)
+
+    def upload(self, member, fileobj):
+        filename = os.path.basename(member.name)
+        if not member.isfile() or member.name != 'uploads/' + filename or filename.startswith('.'):
+            return
+        folder = current_app.config['UPLOAD_FOLDER']
+        if not os.path.exists(folder):
+            os.makedirs(folder, exist_ok=True)
+        path = os.path.join(folder, filename)
+        if not os.path.exists(path):
+            fd, tmp = tempfile.mkstemp(dir=folder, prefix='.import-')
+            with os.fdopen(fd, 'wb') as f:
+                while True:
+                    chunk = fileobj.read(64 * 1024)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+            os.replace(tmp, path)
+            thumbnailer.submit(path)
+        self.counts['files'] += 1
+
+    def run(self, fileobj):
+        """
+        import the archive read from fileobj, a file or a non seekable stream
+        @return: dict of the number of rows or files imported per member
+        """
+        readers = {'users.ndjson': self.import_users, 'categories.ndjson': self.import_categories,
+                   'posts.ndjson': self.import_posts, 'comments.ndjson': self.import_comments,
+                   'images.ndjson': self.import_images}
+        for model in (Post, Comment, Image):
+            if db.session.query(model.id).first() is not None:
+                raise NotEmptyError('the blog already has {}s, import needs an empty one'.format(
+                    model.__tablename__))
+        try:
+            with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+                for member in tar:
+                    if member.name == 'manifest.json':
+                        manifest = json.loads(tar.extractfile(member).read().decode('utf-8'))
+                        if manifest.get('version') != FORMAT_VERSION:
+                            raise TransferError('unsupported archive version {}'.format(manifest.get('version')))
+                    elif member.name in readers:
+                        readers[member.name](self._decoded(_lines(tar.extractfile(member))))
+                    elif member.name.startswith('uploads/'):
+                        self.upload(member, tar.extractfile(member))
+        except TransferError:
+            db.session.rollback()
+            raise
+        except (tarfile.TarError, ValueError, KeyError) as e:
+            db.session.rollback()
+            raise TransferError('bad archive: {}'.format(e))
+        except IntegrityError as e:
+            db.session.rollback()
+            raise TransferError('conflicting rows: {}'.format(e.orig))
+
+        Post.recount_comments()
+        Category.recount_posts()
+        db.session.commit()
+        search.reindex()
+        cache.clear()
+        return self.counts
+
+    @staticmethod
+    def _decoded(rows):
+        for row in rows:
+            for column in TIME_COLUMNS:
+                if column in row:
+                    row[column] = _decode_time(row[column])
+            yield row
+
+
+def import_archive(fileobj, batch_size=1000):
+    return Importer(batch_size).run(fileobj)
@@ -0,0 +1,71 @@
+"""
+   app.uploads
+   Stream uploaded files to disk while hashing them
+"""
+
+import hashlib
+import os
+import tempfile
+from flask import Request, current_app
+from app.thumbnails import remove_variants
+
+
+class HashingFile(object):
+    """
+    temporary file in the upload folder computing the sha256 of what is written
+    to it, so the upload never has to be read back or held in memory
+    """
+
+    def __init__(self, directory):
+        if not os.path.exists(directory):
+            os.makedirs(directory, exist_ok=True)
+        fd, self.name = tempfile.mkstemp(dir=directory, prefix='.upload-')
+        self._file = os.fdopen(fd, 'w+b')
+        self._sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._sha256.hexdigest()
+
+    def persist(self, path):
+        """
+        move the upload to path, atomically replacing any existing file
+        """
+        self._file.close()
+        os.replace(self.name, path)
+        self.name = None
+
+    def close(self):
+        self._file.close()
+        if self.name and os.path.exists(self.name):
+            os.remove(self.name)
+        self.name = None
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """
+    request whose multipart files are spooled straight into the upload folder,
+    in the chunks werkzeug's form parser reads them in
+    """
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return HashingFile(current_app.config['UPLOAD_FOLDER'])
+
+
+def image_path(url):
+    return os.path.join(current_app.config['UPLOAD_FOLDER'], url.split('/')[-1])
+
+
+def remove_image_file(url):
+    path = image_path(url)
+    if os.path.exists(path):
+        os.remove(path)
+    remove_variants(path)
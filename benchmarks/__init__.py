@@ -0,0 +1,5 @@
+"""
+   benchmarks
+   Seeded datasets and latency / throughput measurements of the REST API,
+   run with `flask bench`
+"""
@@ -0,0 +1,44 @@
+"""
+   benchmarks.compare
+   Compare two saved benchmark runs and flag regressions
+"""
+
+import json
+
+# metric, True when a higher value is better
+METRICS = (('p50', False), ('p99', False), ('rps', True))
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+def compare(baseline, current, threshold=0.1):
+    """
+    relative change of every metric present in both runs
+    @param: threshold, relative change beyond which a worse value is a regression
+    @return: list of (target, endpoint, metric, before, after, change, regressed)
+    """
+    rows = []
+    for target, endpoints in sorted(current['results'].items()):
+        for name, stats in sorted(endpoints.items()):
+            before_stats = baseline['results'].get(target, {}).get(name)
+            if not before_stats:
+                continue
+            for metric, higher_is_better in METRICS:
+                before, after = before_stats.get(metric), stats.get(metric)
+                if not before or after is None:
+                    continue
+                change = (after - before) / before
+                worse = -change if higher_is_better else change
+                rows.append((target, name, metric, before, after, change, worse > threshold))
+    return rows
+
+
+def report(rows):
+    lines = []
+    for target, name, metric, before, after, change, regressed in rows:
+        lines.append('{:<9} {:<16} {:<4} {:>10.2f} -> {:>10.2f}  {:>+7.1%}{}'.format(
+            target, name, metric, before, after, change, '  REGRESSION' if regressed else ''))
+    return '\n'.join(lines)
@@ -0,0 +1,121 @@
+"""
+   benchmarks.explain
+   Query plans of every statement the endpoints issue on the seeded dataset,
+   flagging full table scans
+"""
+
+import json
+import random
+import re
+from sqlalchemy import event
+from app import db
+from .runner import Scenario, ClientTarget, dataset, scenarios, login
+
+# the plan of a sqlite statement, a SCAN without USING reads the whole table
+SQLITE_SCAN = re.compile(r'^SCAN (?:TABLE )?(\w+)(?: AS \w+)?(.*)$')
+
+# tables whose rows are few by nature, scanning them is fine
+SMALL_TABLES = ('category', 'role', 'roles_users', 'id_sequence')
+
+
+def extra_scenarios(data):
+    """
+    endpoints the benchmark does not time but whose queries need an index all the same
+    """
+    filenames = data['filenames']
+    return [
+        Scenario('users', 'admin', 'GET', True, lambda rng: ('/api/users', None)),
+        Scenario('delete_photo', 'admin', 'DELETE', True,
+                 lambda rng: ('/api/photos/{}'.format(filenames[-1]), None)),
+    ]
+
+
+def capture(app, random_seed=0):
+    """
+    issue one request of every scenario through the test client
+    @return: list of (scenario name, [(statement, parameters)])
+    """
+    data = dataset()
+    request = ClientTarget(app).session()
+    token = login(request)
+    engine = db.get_engine()
+    captured = []
+
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if not executemany:
+            captured.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', record)
+    try:
+        result = []
+        for scenario in scenarios(data) + extra_scenarios(data):
+            headers = {'Content-Type': 'application/json'}
+            if scenario.auth:
+                headers['Authentication-Token'] = token
+            path, body = scenario.make(random.Random('{}:{}'.format(random_seed, scenario.name)))
+            del captured[:]
+            status = request(scenario.method, path, body, headers)[0]
+            if status >= 400:
+                raise RuntimeError('{} {} answered {}'.format(scenario.method, path, status))
+            result.append((scenario.name, list(captured)))
+    finally:
+        event.remove(engine, 'before_cursor_execute', record)
+    return result
+
+
+def explain(statement, parameters):
+    """
+    @return: (plan rows as dicts, list of fully scanned tables)
+    """
+    engine = db.get_engine()
+    connection = engine.raw_connection()
+    try:
+        cursor = connection.cursor()
+        if engine.dialect.name == 'sqlite':
+            cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+        else:
+            cursor.execute('EXPLAIN ' + statement, parameters)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    finally:
+        connection.close()
+
+    tables = set(db.metadata.tables)
+    scanned = []
+    for row in rows:
+        if 'detail' in row:
+            match = SQLITE_SCAN.match(row['detail'])
+            if match and match.group(1) in tables and 'USING' not in match.group(2):
+                scanned.append(match.group(1))
+        elif row.get('type') == 'ALL' and row.get('table') in tables:
+            scanned.append(row['table'])
+    return rows, scanned
+
+
+def audit(app, allowed=SMALL_TABLES, echo=None):
+    """
+    explain every distinct statement issued by the endpoints
+    @return: list of (scenario name, statement, scanned tables) of the filtered statements
+             scanning a table not in allowed
+    """
+    flagged = []
+    seen = set()
+    for name, statements in capture(app):
+        for statement, parameters in statements:
+            if not statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')) or statement in seen:
+                continue
+            seen.add(statement)
+            rows, scanned = explain(statement, parameters)
+            scanned = [table for table in scanned if table not in allowed]
+            # a statement without WHERE reads the whole table on purpose, a listing or a total
+            if scanned and ' WHERE ' in statement:
+                flagged.append((name, statement, scanned))
+                status = 'SCAN'
+            else:
+                status = 'all' if scanned else 'ok'
+            if echo:
+                echo('{:<16} {:<6} {}'.format(name, status, ' '.join(statement.split())[:110]))
+                if status == 'SCAN':
+                    for row in rows:
+                        echo('{:<23} {}'.format('', json.dumps(row, default=str)))
+    return flagged
@@ -0,0 +1,283 @@
+"""
+   benchmarks.runner
+   Latency percentiles and throughput of every API endpoint, through the flask
+   test client or a real gunicorn process
+"""
+
+import http.client
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import threading
+import time
+from collections import namedtuple
+from datetime import datetime
+from flask import current_app
+from app import db
+from app.models import Post, Category, Image
+from .seed import ADMIN_EMAIL, ADMIN_PASSWORD, WORDS
+
+Scenario = namedtuple('Scenario', 'name suite method auth make')
+
+basedir = os.path.abspath(os.path.join(os.path.dirname(__file__), os.pardir))
+
+
+def dataset():
+    """
+    ids and names the scenarios pick their targets from, in id order
+    """
+    post_ids = [row[0] for row in db.session.query(Post.id).order_by(Post.id)]
+    filenames = [row[0].split('/')[-1] for row in db.session.query(Image.url).order_by(Image.id)]
+    category_ids = [row[0] for row in db.session.query(Category.id).order_by(Category.id)]
+    return {'post_ids': post_ids, 'filenames': filenames, 'category_ids': category_ids}
+
+
+def scenarios(data):
+    """
+    one Scenario per endpoint of app.resources.views, make(rng) returns (path, json body)
+    """
+    post_ids, filenames, category_ids = data['post_ids'], data['filenames'], data['category_ids']
+    write_body = lambda rng: ' '.join(rng.choice(WORDS) for _ in range(200))
+    return [
+        Scenario('posts', 'read', 'GET', False, lambda rng: ('/api/posts', None)),
+        Scenario('posts_no_count', 'read', 'GET', False,
+                 lambda rng: ('/api/posts?count=false&limit=20', None)),
+        Scenario('post', 'read', 'GET', False,
+                 lambda rng: ('/api/posts/{}'.format(rng.choice(post_ids)), None)),
+        Scenario('popular', 'read', 'GET', False, lambda rng: ('/api/posts/popular', None)),
+        Scenario('comments', 'read', 'GET', False,
+                 lambda rng: ('/api/comments/{}'.format(rng.choice(post_ids)), None)),
+        Scenario('categories', 'read', 'GET', False, lambda rng: ('/api/categories', None)),
+        Scenario('category_posts', 'read', 'GET', False,
+                 lambda rng: ('/api/categories/{}/posts'.format(rng.choice(category_ids)), None)),
+        Scenario('archive', 'read', 'GET', False, lambda rng: ('/api/archive', None)),
+        Scenario('search', 'read', 'GET', False,
+                 lambda rng: ('/api/search?q={}'.format(rng.choice(WORDS)), None)),
+        Scenario('photo', 'read', 'GET', False,
+                 lambda rng: ('/api/photos/{}'.format(rng.choice(filenames)), None)),
+        Scenario('session', 'write', 'POST', False,
+                 lambda rng: ('/api/sessions', {'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD})),
+        Scenario('create_post', 'write', 'POST', True,
+                 lambda rng: ('/api/posts', {'title': 'bench {}'.format(rng.random()), 'desc': 'bench',
+                                             'category': 'notes', 'body': write_body(rng)})),
+        Scenario('create_comment', 'write', 'POST', True,
+                 lambda rng: ('/api/comments/{}'.format(rng.choice(post_ids)), {'body': 'bench comment'})),
+    ]
+
+
+def summarize(timings, errors, elapsed):
+    """
+    latency percentiles in milliseconds and requests per second
+    """
+    timings = sorted(timings)
+    n = len(timings)
+    if not n:
+        return {'n': 0, 'errors': errors}
+    pick = lambda q: round(timings[min(n - 1, int(q * n))] * 1000, 3)
+    return {
+        'n': n,
+        'errors': errors,
+        'mean': round(sum(timings) / n * 1000, 3),
+        'p50': pick(0.5),
+        'p90': pick(0.9),
+        'p99': pick(0.99),
+        'max': round(timings[-1] * 1000, 3),
+        'rps': round(n / elapsed, 1) if elapsed else None,
+    }
+
+
+class ClientTarget(object):
+    """
+    requests through the flask test client, in this process
+    """
+    name = 'client'
+
+    def __init__(self, app):
+        self.app = app
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+    def session(self):
+        client = self.app.test_client(use_cookies=False)
+
+        def request(method, path, body, headers):
+            response = client.open(path, method=method, headers=headers,
+                                   data=json.dumps(body) if body is not None else None)
+            data = response.get_data()
+            return response.status_code, data
+        return request
+
+
+class GunicornTarget(object):
+    """
+    requests over keep-alive HTTP connections to a gunicorn started with
+    gunicorn.conf.py and the benchmark config
+    """
+    name = 'gunicorn'
+
+    def __init__(self, app, workers=None, worker_class=None, startup_timeout=30):
+        self.app = app
+        self.workers = workers
+        self.worker_class = worker_class
+        self.startup_timeout = startup_timeout
+        self.process = None
+        self.port = None
+
+    def __enter__(self):
+        with socket.socket() as s:
+            s.bind(('127.0.0.1', 0))
+            self.port = s.getsockname()[1]
+        env = dict(os.environ, FLASK_CONFIG='benchmark', GUNICORN_BIND='127.0.0.1:{}'.format(self.port),
+                   BENCH_DATABASE_URL=self.app.config['SQLALCHEMY_DATABASE_URI'])
+        if self.workers:
+            env['GUNICORN_WORKERS'] = str(self.workers)
+        if self.worker_class:
+            env['GUNICORN_WORKER_CLASS'] = self.worker_class
+        self.process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', 'blog:app'],
+                                        cwd=basedir, env=env,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        deadline = time.time() + self.startup_timeout
+        request = self.session()
+        while True:
+            try:
+                if request('GET', '/api/archive', None, {})[0] == 200:
+                    return self
+            except (OSError, http.client.HTTPException):
+                pass
+            if self.process.poll() is not None or time.time() > deadline:
+                self.__exit__()
+                raise RuntimeError('gunicorn did not start')
+            time.sleep(0.2)
+
+    def __exit__(self, *exc):
+        if self.process is not None and self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait(10)
+
+    def session(self):
+        local = {}
+
+        def request(method, path, body, headers):
+            conn = local.get('conn')
+            if conn is None:
+                conn = local['conn'] = http.client.HTTPConnection('127.0.0.1', self.port, timeout=30)
+            try:
+                conn.request(method, path, json.dumps(body) if body is not None else None, headers)
+                response = conn.getresponse()
+                return response.status, response.read()
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                local.pop('conn')
+                raise
+        return request
+
+
+def login(request):
+    status, data = request('POST', '/api/sessions', {'email': ADMIN_EMAIL, 'password': ADMIN_PASSWORD},
+                           {'Content-Type': 'application/json'})
+    if status != 200:
+        raise RuntimeError('benchmark login failed with {}'.format(status))
+    return json.loads(data.decode('utf-8'))['token']
+
+
+def measure(target, scenario, token, requests, concurrency, warmup, random_seed):
+    """
+    run requests of scenario spread over concurrency threads, after warmup
+    untimed requests
+    """
+    headers = {'Content-Type': 'application/json'}
+    if scenario.auth:
+        headers['Authentication-Token'] = token
+    timings = []
+    errors = [0]
+    lock = threading.Lock()
+
+    def worker(index, count):
+        request = target.session()
+        rng = random.Random('{}:{}:{}'.format(random_seed, scenario.name, index))
+        local = []
+        failed = 0
+        for i in range(warmup + count):
+            path, body = scenario.make(rng)
+            start = time.perf_counter()
+            try:
+                status = request(scenario.method, path, body, headers)[0]
+            except (OSError, http.client.HTTPException):
+                status = None
+            duration = time.perf_counter() - start
+            if i < warmup:
+                continue
+            if status is None or status >= 400:
+                failed += 1
+            local.append(duration)
+        with lock:
+            timings.extend(local)
+            errors[0] += failed
+
+    # the test client runs in this process, with one app context, so it stays single threaded
+    concurrency = concurrency if target.name != 'client' else 1
+    shares = [requests // concurrency + (1 if i < requests % concurrency else 0) for i in range(concurrency)]
+    threads = [threading.Thread(target=worker, args=(i, share)) for i, share in enumerate(shares)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(timings, errors[0], time.perf_counter() - start)
+
+
+def run(targets, suite='read', requests=200, concurrency=4, warmup=10, random_seed=0, echo=None):
+    """
+    measure every scenario of suite ('read', 'write' or 'all') against each target
+    @return: the results document, as saved by save()
+    """
+    data = dataset()
+    selected = [s for s in scenarios(data) if suite == 'all' or s.suite == suite]
+    results = {}
+    for target in targets:
+        with target:
+            token = login(target.session())
+            results[target.name] = {}
+            for scenario in selected:
+                stats = measure(target, scenario, token, requests, concurrency, warmup, random_seed)
+                results[target.name][scenario.name] = stats
+                if echo:
+                    echo(format_row(target.name, scenario.name, stats))
+    return {
+        'meta': {
+            'time': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'database': current_app.config['SQLALCHEMY_DATABASE_URI'].split('://')[0],
+            'posts': len(data['post_ids']),
+            'images': len(data['filenames']),
+            'suite': suite,
+            'requests': requests,
+            'concurrency': concurrency,
+            'seed': random_seed,
+        },
+        'results': results,
+    }
+
+
+def format_row(target, name, stats):
+    if not stats['n']:
+        return '{:<9} {:<16} no requests'.format(target, name)
+    return '{:<9} {:<16} p50 {:>8.2f}ms  p90 {:>8.2f}ms  p99 {:>8.2f}ms  {:>8.1f} req/s  {} errors'.format(
+        target, name, stats['p50'], stats['p90'], stats['p99'], stats['rps'], stats['errors'])
+
+
+def save(document, path):
+    directory = os.path.dirname(path)
+    if directory and not os.path.exists(directory):
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(document, f, indent=2, sort_keys=True)
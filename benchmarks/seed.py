@@ -0,0 +1,111 @@
+"""
+   benchmarks.seed
+   Reproducible datasets of users, posts, comments and images
+"""
+
+import hashlib
+import os
+import random
+from datetime import datetime, timedelta
+from flask import current_app, url_for
+from flask_security.utils import hash_password
+from app import db, cache, search, user_datastore
+from app.models import User, Post, Category, Comment, Image, render_markdown, gravatar_hash
+
+ADMIN_EMAIL = 'bench@example.com'
+ADMIN_PASSWORD = 'bench'
+
+WORDS = ('flask', 'python', 'mysql', 'docker', 'nginx', 'gunicorn', 'cache', 'index', 'query',
+         'latency', 'vue', 'router', 'markdown', 'search', 'upload', 'thread', 'process', 'socket',
+         'replica', 'session', 'token', 'profile', 'metric', 'worker', 'pool', 'cursor', 'keyset')
+
+CATEGORIES = ('python', 'database', 'devops', 'frontend', 'notes')
+
+# smallest valid png, every image file gets a unique trailer so its hash differs
+PNG = bytes.fromhex('89504e470d0a1a0a0000000d4948445200000001000000010806000000'
+                    '1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082')
+
+
+def _sentence(rng, n):
+    return ' '.join(rng.choice(WORDS) for _ in range(n))
+
+
+def _body(rng, paragraphs):
+    parts = ['# ' + _sentence(rng, 4).title()]
+    for i in range(paragraphs):
+        parts.append(_sentence(rng, rng.randint(30, 80)) + '.')
+        if i % 3 == 1:
+            parts.append('```python\nprint("{}")\n```'.format(_sentence(rng, 3)))
+        if i % 4 == 2:
+            parts.append('| a | b |\n|---|---|\n| {} | {} |'.format(rng.choice(WORDS), rng.choice(WORDS)))
+    return '\n\n'.join(parts)
+
+
+def _insert(model, rows, batch_size=1000):
+    for i in range(0, len(rows), batch_size):
+        db.session.execute(model.__table__.insert(), rows[i:i + batch_size])
+
+
+def seed(users=20, posts=1000, comments=5000, images=200, random_seed=0):
+    """
+    replace the database content with a dataset generated from random_seed,
+    the same arguments always produce the same rows
+    @return: dict of the number of rows per table
+    """
+    if not current_app.config.get('BENCHMARK'):
+        raise RuntimeError('refusing to seed a database outside of the benchmark config')
+    rng = random.Random(random_seed)
+    start = datetime(2018, 1, 1)
+
+    db.session.remove()
+    db.drop_all()
+    db.create_all()
+
+    password = hash_password(ADMIN_PASSWORD)
+    admin = user_datastore.create_user(email=ADMIN_EMAIL, name='bench', password=password)
+    user_datastore.add_role_to_user(admin, user_datastore.create_role(name='admin'))
+    db.session.commit()
+    emails = ['user{}@example.com'.format(i) for i in range(1, users)]
+    _insert(User, [{'name': email.split('@')[0], 'email': email, 'email_hash': gravatar_hash(email),
+                    'password': password, 'active': True} for email in emails])
+    _insert(Category, [{'name': name} for name in CATEGORIES])
+    user_ids = [row[0] for row in db.session.query(User.id).order_by(User.id)]
+    category_ids = [row[0] for row in db.session.query(Category.id).order_by(Category.id)]
+
+    rows = []
+    for i in range(posts):
+        body = _body(rng, rng.randint(2, 12))
+        created = start + timedelta(minutes=i * 37)
+        rows.append({'title': _sentence(rng, 4)[:80], 'description': _sentence(rng, 12)[:255],
+                     'body': body, 'body_html': render_markdown(body),
+                     'body_hash': hashlib.sha256(body.encode('utf-8')).hexdigest(),
+                     'created_time': created, 'updated_time': created,
+                     'author_id': rng.choice(user_ids), 'category_id': rng.choice(category_ids)})
+    _insert(Post, rows)
+    Category.recount_posts()
+    post_ids = [row[0] for row in db.session.query(Post.id).order_by(Post.id)]
+
+    _insert(Comment, [{'body': _sentence(rng, rng.randint(5, 40)),
+                       'created_time': start + timedelta(minutes=rng.randint(0, posts * 37)),
+                       'updated_time': start, 'author_id': rng.choice(user_ids),
+                       'post_id': rng.choice(post_ids)} for _ in range(comments)])
+    Post.recount_comments()
+
+    folder = current_app.config['UPLOAD_FOLDER']
+    if not os.path.exists(folder):
+        os.makedirs(folder, exist_ok=True)
+    rows = []
+    with current_app.test_request_context():
+        for i, post_id in enumerate(rng.sample(post_ids, min(images, len(post_ids)))):
+            data = PNG + str(i).encode('ascii')
+            sha256 = hashlib.sha256(data).hexdigest()
+            filename = sha256 + '.png'
+            with open(os.path.join(folder, filename), 'wb') as f:
+                f.write(data)
+            rows.append({'url': url_for('api.photo', filename=filename), 'sha256': sha256, 'post_id': post_id})
+    _insert(Image, rows)
+    db.session.commit()
+
+    search.reindex()
+    cache.clear()
+    return {'users': users, 'posts': posts, 'comments': comments, 'images': len(rows)}
@@ -0,0 +1,75 @@
+"""
+   benchmarks.serializers
+   marshal with json against the compiled serializers with orjson, on payloads
+   of the seeded dataset
+"""
+
+import json
+import platform
+import time
+from datetime import datetime
+from flask import current_app
+from flask_restful import marshal
+from sqlalchemy.orm import defer
+from app.models import User, Post, Comment
+from app.resources import output
+from app.resources.serializers import compile_fields, dumps, orjson
+from .runner import summarize
+
+
+def payloads(limit=20):
+    """
+    (name, field spec, data) of the responses of the list endpoints
+    """
+    posts = Post.eager_query().options(defer(Post.body), defer(Post.body_html)) \
+        .order_by(Post.created_time.desc()).limit(limit).all()
+    post = Post.eager_query().order_by(Post.comment_count.desc()).first()
+    comments = Comment.eager_query().filter_by(post_id=post.id).limit(limit).all()
+    return [
+        ('article_list', output.article_list_fields,
+         {'count': 1000, 'next_cursor': 'cursor', 'posts': [p.to_summary_dict() for p in posts]}),
+        ('article', output.article_fields, post.to_dict()),
+        ('comment_list', output.comment_list_fields,
+         {'count': post.comment_count, 'next_cursor': None, 'comments': [c.to_dict() for c in comments]}),
+        ('user_list', output.user_list_fields, {'users': User.query.all(), 'count': User.query.count()}),
+    ]
+
+
+def _time(f, runs):
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        f()
+        timings.append(time.perf_counter() - start)
+    return timings
+
+
+def run(runs=1000, echo=None):
+    """
+    time serializing and encoding each payload runs times, both ways
+    @return: results in the format of runner.run, under the 'serializers' target
+    """
+    results = {}
+    with current_app.test_request_context():
+        for name, spec, data in payloads():
+            serialize = compile_fields(spec)
+            ways = (('marshal', lambda: json.dumps(marshal(data, spec))),
+                    ('compiled', lambda: dumps(serialize(data))))
+            for way, f in ways:
+                _time(f, 10)
+                results['{}_{}'.format(name, way)] = summarize(_time(f, runs), 0, None)
+            if echo:
+                before, after = results[name + '_marshal']['p50'], results[name + '_compiled']['p50']
+                echo('{:<13} marshal p50 {:>8.3f}ms  compiled p50 {:>8.3f}ms  {:.1f}x'.format(
+                    name, before, after, before / after if after else 0))
+    return {
+        'meta': {
+            'time': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'suite': 'serializers',
+            'runs': runs,
+            'orjson': orjson is not None,
+        },
+        'results': {'serializers': results},
+    }
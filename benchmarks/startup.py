@@ -0,0 +1,88 @@
+"""
+   benchmarks.startup
+   Cold start time of blog.py, measured with python -X importtime in fresh
+   interpreters
+"""
+
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from datetime import datetime
+from .runner import basedir, summarize
+
+IMPORTTIME = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$')
+
+# how blog.py gets imported: by a gunicorn worker, or by a flask command such as deploy
+SCENARIOS = (
+    ('worker', {}),
+    ('cli', {'FLASK_RUN_FROM_CLI': 'true'}),
+)
+
+
+def parse_importtime(stderr):
+    """
+    {module: (self microseconds, cumulative microseconds)} of the top level imports
+    and everything below them
+    """
+    modules = {}
+    for line in stderr.splitlines():
+        match = IMPORTTIME.match(line)
+        if match:
+            modules[match.group(4)] = (int(match.group(1)), int(match.group(2)))
+    return modules
+
+
+def import_blog(env):
+    """
+    import blog in a new interpreter
+    @return: (wall seconds, {module: (self us, cumulative us)})
+    """
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import blog'], cwd=basedir, env=env,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, universal_newlines=True)
+    wall = time.perf_counter() - start
+    if result.returncode:
+        raise RuntimeError('importing blog failed:\n' + result.stderr[-2000:])
+    return wall, parse_importtime(result.stderr)
+
+
+def run(runs=10, config_name='benchmark', top=10, echo=None):
+    """
+    import blog runs times for each scenario, after one run warming the bytecode cache
+    @return: results in the format of runner.run, under the 'startup' target
+    """
+    results = {}
+    slowest = {}
+    for name, extra in SCENARIOS:
+        env = dict(os.environ, FLASK_CONFIG=config_name)
+        env.pop('FLASK_RUN_FROM_CLI', None)
+        env.update(extra)
+        import_blog(env)
+        walls, imports, modules = [], [], {}
+        for _ in range(runs):
+            wall, modules = import_blog(env)
+            walls.append(wall)
+            imports.append(modules['blog'][1] / 1e6)
+        results[name] = summarize(walls, 0, None)
+        results[name + '_import'] = summarize(imports, 0, None)
+        slowest[name] = sorted(((module, cumulative) for module, (_, cumulative) in modules.items()
+                                if '.' not in module and module != 'blog'),
+                               key=lambda item: item[1], reverse=True)[:top]
+        if echo:
+            echo('{:<8} wall p50 {:>8.1f}ms  import blog p50 {:>8.1f}ms  {}'.format(
+                name, results[name]['p50'], results[name + '_import']['p50'],
+                ', '.join('{} {:.0f}ms'.format(module, us / 1000) for module, us in slowest[name][:5])))
+    return {
+        'meta': {
+            'time': datetime.utcnow().isoformat(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'suite': 'startup',
+            'runs': runs,
+            'slowest': slowest,
+        },
+        'results': {'startup': results},
+    }
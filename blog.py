@@ -1,11 +1,15 @@
 import os
-from app import create_app, db, user_datastore
-from app.models import User, Role
-from flask_migrate import Migrate, upgrade
+import click
+from app import create_app, db, user_datastore, search
+from app.models import User, Role, Post
 from flask_security.utils import hash_password
 
 app = create_app(os.getenv('FLASK_CONFIG') or 'default')
-migrate = Migrate(app, db)
+
+# alembic is only needed by the db and deploy commands, workers skip importing it
+if os.getenv('FLASK_RUN_FROM_CLI') == 'true':
+    from flask_migrate import Migrate
+    migrate = Migrate(app, db)
 
 
 def create_superuser():
@@ -39,6 +43,127 @@ def test():
 
 @app.cli.command()
 def deploy():
+    from flask_migrate import upgrade
     upgrade()
     db.create_all()
     create_superuser()
+    if not search.count():
+        search.reindex()
+
+
+@app.cli.command()
+@click.option('--force', is_flag=True, help='Re-render posts whose body is unchanged.')
+@click.option('--batch-size', default=500, help='Number of posts committed at a time.')
+def render(force, batch_size):
+    """Render markdown of existing posts into body_html."""
+    last_id = 0
+    rendered = 0
+    while True:
+        posts = Post.query.filter(Post.id > last_id).order_by(Post.id).limit(batch_size).all()
+        if not posts:
+            break
+        for post in posts:
+            if post.render_body(force=force):
+                rendered += 1
+        db.session.commit()
+        last_id = posts[-1].id
+    print('rendered {} posts'.format(rendered))
+
+
+@app.cli.command()
+@click.option('--suite', type=click.Choice(['read', 'write', 'all', 'startup', 'serializers']),
+              default='read', help='Endpoints to measure, write endpoints change the dataset. startup times '
+                                   'importing blog.py, serializers the encoding of list responses.')
+@click.option('--target', type=click.Choice(['client', 'gunicorn', 'both']), default='client',
+              help='Measure through the test client, a gunicorn process, or both.')
+@click.option('--seed/--no-seed', default=True, help='Regenerate the dataset before measuring.')
+@click.option('--users', default=20)
+@click.option('--posts', default=1000)
+@click.option('--comments', default=5000)
+@click.option('--images', default=200)
+@click.option('--random-seed', default=0, help='Seed of the dataset and of the request mix.')
+@click.option('--requests', default=200, help='Timed requests per endpoint, imports per startup scenario, or a fifth of the encodings per payload.')
+@click.option('--concurrency', default=4, help='Client threads for the gunicorn target.')
+@click.option('--workers', type=int, help='gunicorn workers, defaults to the serving profile.')
+@click.option('--output', default='benchmarks/results/latest.json', help='Where to save the results.')
+@click.option('--compare', 'baseline', type=click.Path(exists=True), help='Earlier results to compare with.')
+@click.option('--threshold', default=0.1, help='Relative slowdown reported as a regression.')
+def bench(suite, target, seed, users, posts, comments, images, random_seed, requests, concurrency,
+          workers, output, baseline, threshold):
+    """Benchmark the API on a seeded dataset, run with FLASK_CONFIG=benchmark."""
+    from benchmarks import seed as seeding, runner, serializers, startup, compare
+
+    if not app.config.get('BENCHMARK'):
+        raise click.UsageError('set FLASK_CONFIG=benchmark, seeding replaces the database')
+    if suite != 'startup' and seed:
+        print('seeded {}'.format(seeding.seed(users, posts, comments, images, random_seed)))
+    if suite == 'startup':
+        document = startup.run(min(requests, 50), echo=print)
+    elif suite == 'serializers':
+        document = serializers.run(requests * 5, echo=print)
+    else:
+        targets = []
+        if target in ('client', 'both'):
+            targets.append(runner.ClientTarget(app))
+        if target in ('gunicorn', 'both'):
+            targets.append(runner.GunicornTarget(app, workers=workers))
+        document = runner.run(targets, suite, requests, concurrency, random_seed=random_seed, echo=print)
+    runner.save(document, output)
+    print('saved {}'.format(output))
+    if baseline:
+        rows = compare.compare(compare.load(baseline), document, threshold)
+        print(compare.report(rows))
+        if any(row[-1] for row in rows):
+            raise SystemExit(1)
+
+
+@app.cli.command()
+@click.option('--seed/--no-seed', default=True, help='Regenerate the dataset before explaining.')
+@click.option('--allow', multiple=True, help='Table whose full scans are accepted, repeat for more. '
+                                            'Defaults to the small lookup tables.')
+@click.option('--verbose', is_flag=True, help='Print every statement, not only the flagged ones.')
+def explain(seed, allow, verbose):
+    """Explain the queries of every endpoint and flag full table scans, run with FLASK_CONFIG=benchmark."""
+    from benchmarks import seed as seeding, explain as explaining
+
+    if not app.config.get('BENCHMARK'):
+        raise click.UsageError('set FLASK_CONFIG=benchmark, seeding replaces the database')
+    if seed:
+        print('seeded {}'.format(seeding.seed()))
+    flagged = explaining.audit(app, allowed=allow or explaining.SMALL_TABLES, echo=print if verbose else None)
+    for name, statement, tables in flagged:
+        print('{}: full scan of {}\n    {}'.format(name, ', '.join(tables), ' '.join(statement.split())))
+    print('{} statements with a full table scan'.format(len(flagged)))
+    if flagged:
+        raise SystemExit(1)
+
+
+@app.cli.command()
+def reindex():
+    """Rebuild the full-text search index from the posts table."""
+    print('indexed {} posts'.format(search.reindex()))
+
+
+@app.cli.command()
+@click.argument('path', default='blog-export.tar.gz')
+@click.option('--batch-size', default=1000, help='Rows read from the database at a time.')
+def export(path, batch_size):
+    """Export posts, comments, users and uploads to a tar archive."""
+    from app.transfer import write_archive
+    with open(path, 'wb') as f:
+        counts = write_archive(f, batch_size)
+    print('exported {} to {}'.format(counts, path))
+
+
+@app.cli.command('import')
+@click.argument('path', type=click.Path(exists=True, dir_okay=False))
+@click.option('--batch-size', default=1000, help='Rows inserted per commit.')
+def import_(path, batch_size):
+    """Import an archive written by flask export into an empty blog."""
+    from app.transfer import import_archive, TransferError
+    try:
+        with open(path, 'rb') as f:
+            counts = import_archive(f, batch_size)
+    except TransferError as e:
+        raise click.ClickException(str(e))
+    print('imported {}'.format(counts))
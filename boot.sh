@@ -10,4 +10,4 @@ while true; do
     sleep 5
 done
 
-exec gunicorn -b :5000 --access-logfile - --error-logfile - blog:app
\ No newline at end of file
+exec gunicorn -c gunicorn.conf.py blog:app
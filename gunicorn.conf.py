@@ -0,0 +1,39 @@
+"""
+   gunicorn.conf
+   Production serving profile, the settings live in config.ServingConfig
+"""
+
+from config import ServingConfig as serving
+
+if serving.WORKER_CLASS == 'gevent':
+    # patch before blog.py imports the app, so PyMySQL and the cache locks use green sockets and locks
+    try:
+        from gevent import monkey
+    except ImportError:
+        raise SystemExit('GUNICORN_WORKER_CLASS=gevent needs gevent, run `pip install gevent` '
+                         'or pick the gthread or sync worker class')
+    monkey.patch_all()
+
+bind = serving.BIND
+worker_class = serving.WORKER_CLASS
+workers = serving.WORKERS
+threads = serving.THREADS
+worker_connections = serving.WORKER_CONNECTIONS
+preload_app = serving.PRELOAD
+timeout = serving.TIMEOUT
+keepalive = serving.KEEPALIVE
+max_requests = serving.MAX_REQUESTS
+max_requests_jitter = serving.MAX_REQUESTS_JITTER
+accesslog = '-'
+errorlog = '-'
+
+
+def post_fork(server, worker):
+    """
+    drop the connections a preloaded app may have opened in the master,
+    each worker has to open its own
+    """
+    from blog import app
+    from app import db
+    with app.app_context():
+        db.dispose_engines(app)
@@ -0,0 +1,26 @@
+"""add content hash to image
+
+Revision ID: 5f0b7c3e1a92
+Revises: d81e4b6a9c25
+Create Date: 2026-10-18 12:03:52.661370
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5f0b7c3e1a92'
+down_revision = 'd81e4b6a9c25'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('image', sa.Column('sha256', sa.String(length=64), nullable=True))
+    op.create_index(op.f('ix_image_sha256'), 'image', ['sha256'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_image_sha256'), table_name='image')
+    op.drop_column('image', 'sha256')
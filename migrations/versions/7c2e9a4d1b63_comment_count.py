@@ -0,0 +1,28 @@
+"""add post comment count and comment thread index
+
+Revision ID: 7c2e9a4d1b63
+Revises: 5f0b7c3e1a92
+Create Date: 2026-10-18 21:02:17.310284
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7c2e9a4d1b63'
+down_revision = '5f0b7c3e1a92'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('post', sa.Column('comment_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute('UPDATE post SET comment_count = '
+               '(SELECT count(comment.id) FROM comment WHERE comment.post_id = post.id)')
+    op.create_index('ix_comment_post_id_created_time', 'comment', ['post_id', 'created_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_comment_post_id_created_time', table_name='comment')
+    op.drop_column('post', 'comment_count')
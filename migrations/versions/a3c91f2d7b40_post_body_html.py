@@ -0,0 +1,26 @@
+"""add rendered body html and body hash to post
+
+Revision ID: a3c91f2d7b40
+Revises: 569cc90d13f3
+Create Date: 2026-10-18 10:02:11.518204
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3c91f2d7b40'
+down_revision = '569cc90d13f3'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('post', sa.Column('body_html', sa.Text(), nullable=True))
+    op.add_column('post', sa.Column('body_hash', sa.String(length=64), nullable=True))
+
+
+def downgrade():
+    op.drop_column('post', 'body_hash')
+    op.drop_column('post', 'body_html')
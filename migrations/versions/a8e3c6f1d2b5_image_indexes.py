@@ -0,0 +1,26 @@
+"""index image url and post_id
+
+Revision ID: a8e3c6f1d2b5
+Revises: f3b6d9a1c4e2
+Create Date: 2026-10-18 14:06:37.218463
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e3c6f1d2b5'
+down_revision = 'f3b6d9a1c4e2'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index(op.f('ix_image_url'), 'image', ['url'], unique=False)
+    op.create_index(op.f('ix_image_post_id'), 'image', ['post_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_image_post_id'), table_name='image')
+    op.drop_index(op.f('ix_image_url'), table_name='image')
@@ -0,0 +1,31 @@
+"""add gravatar hash of the user email
+
+Revision ID: b4d8e1f3a6c7
+Revises: 7c2e9a4d1b63
+Create Date: 2026-10-18 21:34:40.118207
+
+"""
+import hashlib
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b4d8e1f3a6c7'
+down_revision = '7c2e9a4d1b63'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('user', sa.Column('email_hash', sa.String(length=32), nullable=True))
+    user = sa.table('user', sa.column('id', sa.Integer), sa.column('email', sa.String),
+                    sa.column('email_hash', sa.String))
+    conn = op.get_bind()
+    for user_id, email in conn.execute(sa.select([user.c.id, user.c.email])).fetchall():
+        email_hash = hashlib.md5((email or '').strip().lower().encode('utf-8')).hexdigest()
+        conn.execute(user.update().where(user.c.id == user_id).values(email_hash=email_hash))
+
+
+def downgrade():
+    op.drop_column('user', 'email_hash')
@@ -0,0 +1,26 @@
+"""add post views
+
+Revision ID: c7d2f4a9e8b1
+Revises: e5a7c9b2d4f1
+Create Date: 2026-10-18 23:02:41.180355
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7d2f4a9e8b1'
+down_revision = 'e5a7c9b2d4f1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('post', sa.Column('views', sa.Integer(), server_default='0', nullable=False))
+    op.create_index(op.f('ix_post_views'), 'post', ['views'], unique=False)
+
+
+def downgrade():
+    op.drop_index(op.f('ix_post_views'), table_name='post')
+    op.drop_column('post', 'views')
@@ -0,0 +1,28 @@
+"""add updated_time to post and comment
+
+Revision ID: d81e4b6a9c25
+Revises: a3c91f2d7b40
+Create Date: 2026-10-18 11:14:37.240915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd81e4b6a9c25'
+down_revision = 'a3c91f2d7b40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('post', sa.Column('updated_time', sa.DateTime(), nullable=True))
+    op.add_column('comment', sa.Column('updated_time', sa.DateTime(), nullable=True))
+    op.execute('UPDATE post SET updated_time = created_time')
+    op.execute('UPDATE comment SET updated_time = created_time')
+
+
+def downgrade():
+    op.drop_column('comment', 'updated_time')
+    op.drop_column('post', 'updated_time')
@@ -0,0 +1,28 @@
+"""add category post count and category listing index
+
+Revision ID: e5a7c9b2d4f1
+Revises: b4d8e1f3a6c7
+Create Date: 2026-10-18 22:10:05.524731
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5a7c9b2d4f1'
+down_revision = 'b4d8e1f3a6c7'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('category', sa.Column('post_count', sa.Integer(), server_default='0', nullable=False))
+    op.execute('UPDATE category SET post_count = '
+               '(SELECT count(post.id) FROM post WHERE post.category_id = category.id)')
+    op.create_index('ix_post_category_id_created_time', 'post', ['category_id', 'created_time'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_post_category_id_created_time', table_name='post')
+    op.drop_column('category', 'post_count')
@@ -0,0 +1,28 @@
+"""add id sequence
+
+Revision ID: f3b6d9a1c4e2
+Revises: c7d2f4a9e8b1
+Create Date: 2026-10-18 23:41:12.604118
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f3b6d9a1c4e2'
+down_revision = 'c7d2f4a9e8b1'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('id_sequence',
+    sa.Column('name', sa.String(length=64), nullable=False),
+    sa.Column('next_value', sa.BigInteger(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('id_sequence')
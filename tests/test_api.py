@@ -1,11 +1,20 @@
 import os
+import time
 from io import BytesIO
 import unittest
-from app import create_app, db, user_datastore
+from app import create_app, db, user_datastore, cache, background
+from app.models import Post, Category, Comment, Image
+from flask_sqlalchemy import get_debug_queries
 import json
+import hashlib
 from flask_security.utils import hash_password
 import shutil
 
+try:
+    from PIL import Image as PILImage
+except ImportError:
+    PILImage = None
+
 
 class APITestCase(unittest.TestCase):
     def setUp(self):
@@ -65,6 +74,232 @@ class APITestCase(unittest.TestCase):
         )
         return response, json_response
 
+    def create_posts(self, n, prefix='a'):
+        """
+        create n posts, each with its own author, category, image and comment
+        """
+        for i in range(n):
+            name = '{}{}'.format(prefix, i)
+            user = user_datastore.create_user(email='{}@example.com'.format(name), name=name)
+            post = Post(title=name, body='body', description='desc', author=user,
+                        category=Category(name=name), img=Image(url='/api/photos/{}.png'.format(name)))
+            db.session.add(Comment(body='comment', post=post, author=user))
+            db.session.add(post)
+        db.session.commit()
+        return post
+
+    def count_queries(self, url):
+        cache.clear()
+        before = len(get_debug_queries())
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(get_debug_queries()) - before
+
+    def test_list_query_count_is_constant(self):
+        self.create_posts(2)
+        few = self.count_queries('/api/posts?count=false')
+        self.create_posts(6, prefix='b')
+        many = self.count_queries('/api/posts?count=false')
+        self.assertEqual(few, many)
+        # validators aggregate + the page itself
+        self.assertEqual(many, 2)
+
+    def test_comment_list_query_count_is_constant(self):
+        post = self.create_posts(1)
+        few = self.count_queries('/api/comments/{}'.format(post.id))
+        for i in range(6):
+            user = user_datastore.create_user(email='reader{}@example.com'.format(i), name='reader{}'.format(i))
+            db.session.add(Comment(body='comment', post=post, author=user))
+        db.session.commit()
+        many = self.count_queries('/api/comments/{}'.format(post.id))
+        self.assertEqual(few, many)
+
+    def test_comment_list_paginated(self):
+        post = self.create_posts(1)
+        user = user_datastore.create_user(email='reader@example.com', name='reader')
+        for i in range(5):
+            db.session.add(Comment(body='c{}'.format(i), post=post, author=user))
+        db.session.commit()
+        self.assertEqual(Post.query.get(post.id).comment_count, 6)
+
+        bodies = []
+        url = '/api/comments/{}?limit=2'.format(post.id)
+        while url:
+            page = json.loads(self.client.get(url).get_data(as_text=True))
+            self.assertEqual(page['count'], 6)
+            bodies.extend(c['body'] for c in page['comments'])
+            url = page['next_cursor'] and '/api/comments/{}?limit=2&cursor={}'.format(post.id, page['next_cursor'])
+        self.assertEqual(bodies, ['c4', 'c3', 'c2', 'c1', 'c0', 'comment'])
+
+        db.session.delete(Comment.query.filter_by(body='c0').one())
+        db.session.commit()
+        self.assertEqual(Post.query.get(post.id).comment_count, 5)
+        self.assertEqual(self.client.get('/api/comments/404').status_code, 404)
+
+    def test_avatar_uses_stored_email_hash(self):
+        user = user_datastore.create_user(email=' Reader@Example.com', name='reader')
+        db.session.commit()
+        self.assertEqual(user.email_hash, hashlib.md5(b'reader@example.com').hexdigest())
+        self.assertIn(user.email_hash, user.avatar(50))
+        user.email = 'other@example.com'
+        db.session.commit()
+        self.assertEqual(user.avatar(50), 'https://www.gravatar.com/avatar/{}?d=retro&s=50'.format(
+            hashlib.md5(b'other@example.com').hexdigest()))
+
+        post = self.create_posts(1)
+        for i in range(3):
+            db.session.add(Comment(body='c{}'.format(i), post=post, author=user))
+        db.session.commit()
+        with self.app.test_request_context():
+            comments = Comment.query.filter_by(author=user).all()
+            self.assertIs(comments[0].to_dict()['author_avatar'], comments[2].to_dict()['author_avatar'])
+
+    def test_categories(self):
+        new_response, json_response = self.add_post()
+        post = json.loads(new_response.get_data(as_text=True))
+        headers = {'Content-Type': 'application/json', 'Authorization': json_response['token']}
+        for i in range(4):
+            self.client.post('/api/posts', headers=headers, data=json.dumps(
+                {'title': 'p{}'.format(i), 'desc': 'd', 'body': 'b', 'category': 'python'}))
+        response = self.client.get('/api/categories')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['categories'],
+                         [{'id': 1, 'name': 'python', 'post_count': 5}])
+
+        self.client.put('/api/posts/{}'.format(post['id']), headers=headers, data=json.dumps(
+            {'title': 'test', 'desc': 'hello', 'body': 'ni hao', 'category': 'go'}))
+        self.client.delete('/api/posts/{}'.format(post['id'] + 1), headers=headers)
+        categories = json.loads(self.client.get('/api/categories').get_data(as_text=True))['categories']
+        self.assertEqual([(c['name'], c['post_count']) for c in categories], [('go', 1), ('python', 3)])
+
+        titles = []
+        url = '/api/categories/1/posts?limit=2'
+        while url:
+            page = json.loads(self.client.get(url).get_data(as_text=True))
+            self.assertEqual(page['count'], 3)
+            titles.extend(p['title'] for p in page['posts'])
+            url = page['next_cursor'] and '/api/categories/1/posts?limit=2&cursor=' + page['next_cursor']
+        self.assertEqual(titles, ['p3', 'p2', 'p1'])
+        self.assertEqual(self.client.get('/api/categories/404/posts').status_code, 404)
+
+    def test_popular_posts(self):
+        self.create_posts(4)
+        for post_id, views in ((2, 4), (4, 1)):
+            for _ in range(views):
+                self.assertEqual(self.client.get('/api/posts/{}'.format(post_id)).status_code, 200)
+        etag = self.client.get('/api/posts/4').headers['ETag']
+        self.assertEqual(self.client.get('/api/posts/4', headers={'If-None-Match': etag}).status_code, 304)
+        self.assertEqual(self.client.get('/api/posts/404').status_code, 404)
+        background.flush(self.app)
+
+        posts = json.loads(self.client.get('/api/posts/popular?limit=3').get_data(as_text=True))['posts']
+        self.assertEqual([(p['id'], p['views'], p['recent_views']) for p in posts], [(2, 4, 4), (4, 3, 3), (3, 0, 0)])
+        self.assertNotIn('body', posts[0])
+
+    def test_archive(self):
+        self.create_posts(3)
+        self.assertEqual(self.count_queries('/api/archive'), 2)
+        response = self.client.get('/api/archive')
+        archives = json.loads(response.get_data(as_text=True))
+        self.assertEqual(len(archives), 1)
+        self.assertEqual(archives[0]['count'], 3)
+        self.assertEqual([p['title'] for p in archives[0]['posts']], ['a2', 'a1', 'a0'])
+
+        etag = response.headers['ETag']
+        response = self.client.get('/api/archive', headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 304)
+
+    def test_conditional_get(self):
+        new_response, json_response = self.add_post()
+        post = json.loads(new_response.get_data(as_text=True))
+        for url in ['/api/posts/{}'.format(post['id']), '/api/posts',
+                    '/api/comments/{}'.format(post['id']), '/api/archive']:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            etag = response.headers['ETag']
+            last_modified = response.headers['Last-Modified']
+            response = self.client.get(url, headers={'If-None-Match': etag})
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.get_data(), b'')
+            response = self.client.get(url, headers={'If-Modified-Since': last_modified})
+            self.assertEqual(response.status_code, 304)
+            response = self.client.get(url, headers={'If-None-Match': '"stale"'})
+            self.assertEqual(response.status_code, 200)
+
+        response = self.client.get('/api/posts/{}'.format(post['id']))
+        etag = response.headers['ETag']
+        self.client.put(
+            '/api/posts/{}'.format(post['id']),
+            headers={'Content-Type': 'application/json', 'Authorization': json_response['token']},
+            data=json.dumps({
+                    'title': 'test2',
+                    'desc': 'hello',
+                    'body': 'ni hao',
+                    'category': 'python',
+                })
+        )
+        response = self.client.get('/api/posts/{}'.format(post['id']), headers={'If-None-Match': etag})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response.headers['ETag'], etag)
+
+    def test_if_modified_since_after_comment_and_delete(self):
+        new_response, json_response = self.add_post()
+        post_id = json.loads(new_response.get_data(as_text=True))['id']
+        other_id = self.create_posts(1).id
+        headers = {'Content-Type': 'application/json', 'Authorization': json_response['token']}
+
+        def last_modified(*urls):
+            return dict((url, self.client.get(url).headers['Last-Modified']) for url in urls)
+
+        def modified_since(dates):
+            return dict((url, self.client.get(url, headers={'If-Modified-Since': date}).status_code)
+                        for url, date in dates.items())
+
+        post_url, comments_url = '/api/posts/{}'.format(post_id), '/api/comments/{}'.format(post_id)
+        dates = last_modified(post_url, comments_url, '/api/posts')
+        # Last-Modified has a resolution of a second
+        time.sleep(1)
+        self.client.post(comments_url, headers=headers, data=json.dumps({'body': 'new comment'}))
+        self.assertEqual(modified_since(dates), {post_url: 200, comments_url: 200, '/api/posts': 200})
+
+        dates = last_modified('/api/posts', '/api/archive')
+        time.sleep(1)
+        self.assertEqual(self.client.delete('/api/posts/{}'.format(other_id), headers=headers).status_code, 201)
+        self.assertEqual(modified_since(dates), {'/api/posts': 200, '/api/archive': 200})
+
+    def test_token_lookup_is_cached(self):
+        token = self.login_as_admin()['token']
+        headers = {'Authorization': token}
+        self.assertEqual(self.client.get('/api/cache', headers=headers).status_code, 200)
+        before = len(get_debug_queries())
+        self.assertEqual(self.client.get('/api/cache', headers=headers).status_code, 200)
+        self.assertEqual(len(get_debug_queries()) - before, 0)
+        token_client = self.app.test_client(use_cookies=False)
+        token_headers = {'Authentication-Token': token}
+        self.assertEqual(token_client.get('/api/cache', headers=token_headers).status_code, 200)
+        before = len(get_debug_queries())
+        self.assertEqual(token_client.get('/api/cache', headers=token_headers).status_code, 200)
+        self.assertEqual(len(get_debug_queries()) - before, 0)
+
+        # writes in a cached session still see a session-bound user
+        response = self.client.post(
+            '/api/posts',
+            headers={'Content-Type': 'application/json', 'Authorization': token},
+            data=json.dumps({
+                    'title': 'test',
+                    'desc': 'hello',
+                    'body': 'ni hao',
+                    'category': 'python',
+                })
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data(as_text=True))['author'], 'test')
+
+        user = user_datastore.find_user(email='test@example.com')
+        user_datastore.remove_role_from_user(user, 'admin')
+        db.session.commit()
+        self.assertNotEqual(self.client.get('/api/cache', headers=headers).status_code, 200)
+        self.assertNotEqual(token_client.get('/api/cache', headers=token_headers).status_code, 200)
+
     def test_register_success(self):
         response = self.client.post(
             '/api/users',
@@ -182,6 +417,158 @@ class APITestCase(unittest.TestCase):
         )
         self.assertEqual(response.status_code, 404)
 
+    def test_metrics(self):
+        self.assertNotEqual(self.client.get('/api/_metrics').status_code, 200)
+        new_response, json_response = self.add_post()
+        post_id = json.loads(new_response.get_data(as_text=True))['id']
+        self.app.config['SLOW_REQUEST_THRESHOLD'] = 0
+        self.app.config['PROFILE_SAMPLE_RATE'] = 1
+        self.app.config['PROFILE_DIR'] = os.path.join(self.app.config['UPLOAD_FOLDER'], 'profiles')
+        with self.assertLogs('app.metrics', 'WARNING') as logs:
+            self.client.get('/api/posts/{}'.format(post_id))
+        self.assertIn('api.article', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+        self.assertEqual(len(os.listdir(self.app.config['PROFILE_DIR'])), 1)
+
+        response = self.client.get('/api/_metrics', headers={'Authorization': json_response['token']})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'text/plain')
+        body = response.get_data(as_text=True)
+        self.assertIn('blog_request_duration_seconds{endpoint="api.article",quantile="0.99"}', body)
+        self.assertIn('blog_request_queries_count{endpoint="api.article"} 1', body)
+        self.assertIn('blog_request_markdown_seconds_sum{endpoint="api.articlelist"}', body)
+        self.assertIn('blog_cache_misses_total', body)
+
+    def test_article_body_rendered_on_write(self):
+        new_response, json_response = self.add_post()
+        post_id = json.loads(new_response.get_data(as_text=True))['id']
+        post = Post.query.get(post_id)
+        self.assertEqual(post.body_html, '<p>ni hao</p>')
+        old_hash = post.body_hash
+        self.client.put(
+            '/api/posts/{}'.format(post_id),
+            headers={'Content-Type': 'application/json', 'Authorization': json_response['token']},
+            data=json.dumps({
+                    'title': 'test',
+                    'desc': 'hello',
+                    'body': '# title',
+                    'category': 'python',
+                })
+        )
+        db.session.expire_all()
+        post = Post.query.get(post_id)
+        self.assertNotEqual(post.body_hash, old_hash)
+        response = self.client.get('/api/posts/{}'.format(post_id))
+        json_response = json.loads(response.get_data(as_text=True))
+        self.assertEqual(json_response['body'], post.body_html)
+        self.assertIn('<h1', json_response['body'])
+
+    def test_list_articles_paginated(self):
+        json_response = self.login_as_admin()
+        for i in range(5):
+            self.client.post(
+                '/api/posts',
+                headers={'Content-Type': 'application/json', 'Authorization': json_response['token']},
+                data=json.dumps({
+                        'title': 'test{}'.format(i),
+                        'desc': 'hello',
+                        'body': 'ni hao',
+                        'category': 'python',
+                    })
+            )
+        titles = []
+        cursor = None
+        while True:
+            url = '/api/posts?limit=2' + ('&cursor=' + cursor if cursor else '')
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            page = json.loads(response.get_data(as_text=True))
+            self.assertEqual(page['count'], 5)
+            self.assertLessEqual(len(page['posts']), 2)
+            self.assertNotIn('body', page['posts'][0])
+            titles.extend(p['title'] for p in page['posts'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        self.assertEqual(titles, ['test4', 'test3', 'test2', 'test1', 'test0'])
+
+        response = self.client.get('/api/posts?count=false')
+        self.assertIsNone(json.loads(response.get_data(as_text=True))['count'])
+        response = self.client.get('/api/posts?cursor=bogus')
+        self.assertEqual(response.status_code, 400)
+
+    def test_writes_invalidate_cached_reads(self):
+        new_response, json_response = self.add_post()
+        post = json.loads(new_response.get_data(as_text=True))
+        token = json_response['token']
+        self.client.get('/api/posts/{}'.format(post['id']))
+        self.client.get('/api/posts')
+        self.client.get('/api/comments/{}'.format(post['id']))
+        self.client.put(
+            '/api/posts/{}'.format(post['id']),
+            headers={'Content-Type': 'application/json', 'Authorization': token},
+            data=json.dumps({
+                    'title': 'test2',
+                    'desc': 'hello',
+                    'body': 'ni hao',
+                    'category': 'python',
+                    'img_id': post['img']['id']
+                })
+        )
+        self.client.post(
+            '/api/comments/{}'.format(post['id']),
+            headers={'Content-Type': 'application/json', 'Authorization': token},
+            data=json.dumps({'body': 'ni hao'})
+        )
+        response = self.client.get('/api/posts/{}'.format(post['id']))
+        self.assertEqual(json.loads(response.get_data(as_text=True))['title'], 'test2')
+        response = self.client.get('/api/posts')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['posts'][0]['title'], 'test2')
+        response = self.client.get('/api/comments/{}'.format(post['id']))
+        comments = json.loads(response.get_data(as_text=True))
+        self.assertEqual(comments['count'], 1)
+        self.assertEqual(len(comments['comments']), 1)
+        response = self.client.get('/api/posts')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['posts'][0]['comment_count'], 1)
+
+        self.client.delete(
+            '/api/photos/{}'.format(post['img']['filename']),
+            headers={'Authorization': token},
+        )
+        response = self.client.get('/api/posts/{}'.format(post['id']))
+        self.assertEqual(json.loads(response.get_data(as_text=True))['img']['url'], None)
+
+        response = self.client.get('/api/cache', headers={'Authorization': token})
+        stats = json.loads(response.get_data(as_text=True))
+        self.assertGreater(stats['misses'], 0)
+
+    def test_search(self):
+        json_response = self.login_as_admin()
+        headers = {'Content-Type': 'application/json', 'Authorization': json_response['token']}
+        for title, body in [('flask tips', 'routing and blueprints'),
+                            ('vue notes', 'components talk to the flask api'),
+                            ('mysql', 'indexes')]:
+            self.client.post('/api/posts', headers=headers, data=json.dumps({
+                'title': title, 'desc': 'hello', 'body': body, 'category': 'python'}))
+
+        response = self.client.get('/api/search?q=flask')
+        self.assertEqual(response.status_code, 200)
+        results = json.loads(response.get_data(as_text=True))['results']
+        # a title match outranks a body match
+        self.assertEqual([r['title'] for r in results], ['flask tips', 'vue notes'])
+        self.assertIn('<mark>', results[1]['snippet'])
+
+        post_id = results[0]['id']
+        self.client.put('/api/posts/{}'.format(post_id), headers=headers, data=json.dumps({
+            'title': 'django tips', 'desc': 'hello', 'body': 'views', 'category': 'python'}))
+        self.client.delete('/api/posts/{}'.format(results[1]['id']), headers=headers)
+        response = self.client.get('/api/search?q=flask')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['results'], [])
+        response = self.client.get('/api/search?q=django')
+        self.assertEqual(json.loads(response.get_data(as_text=True))['results'][0]['id'], post_id)
+        response = self.client.get('/api/search?q=" OR NEAR(')
+        self.assertEqual(response.status_code, 200)
+
     def test_delete_article(self):
         new_response, json_response = self.add_post()
         response = self.client.delete(
@@ -210,11 +597,70 @@ class APITestCase(unittest.TestCase):
         response, _ = self.upload_photo()
         self.assertEqual(response.status_code, 200)
         json_response = json.loads(response.get_data(as_text=True))
-        self.assertEqual(json_response['url'], '/api/photos/test.png')
+        sha256 = hashlib.sha256(b'my file contents').hexdigest()
+        self.assertEqual(json_response['url'], '/api/photos/{}.png'.format(sha256))
         response = self.client.get(
-            '/api/photos/test.png',
+            json_response['url'],
         )
         self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.get_data(), b'my file contents')
+
+    def test_photo_accel_redirect(self):
+        response, _ = self.upload_photo()
+        img = json.loads(response.get_data(as_text=True))
+        response = self.client.get(img['url'])
+        self.assertEqual(response.headers['Cache-Control'], 'public, max-age=31536000, immutable')
+        response.close()
+
+        self.app.config['PHOTO_ACCEL_REDIRECT'] = '/_uploads/'
+        response = self.client.get(img['url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.headers['X-Accel-Redirect'], '/_uploads/' + img['filename'])
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(response.get_data(), b'')
+        self.assertIn('immutable', response.headers['Cache-Control'])
+        self.assertEqual(self.client.get('/api/photos/missing.png').status_code, 404)
+
+    def test_upload_file_deduplicated(self):
+        response, json_response = self.upload_photo()
+        first = json.loads(response.get_data(as_text=True))
+        headers = {'Content-Type': 'multipart/form-data', 'Authorization': json_response['token']}
+        response = self.client.post('/api/photos', headers=headers,
+                                    data=dict(file=(BytesIO(b'my file contents'), "other.png")))
+        self.assertEqual(json.loads(response.get_data(as_text=True))['id'], first['id'])
+        self.assertEqual(os.listdir(self.app.config['UPLOAD_FOLDER']), [first['filename']])
+
+        self.app.config['MAX_CONTENT_LENGTH'] = 64
+        response = self.client.post('/api/photos', headers=headers,
+                                    data=dict(file=(BytesIO(b'x' * 1024), "big.png")))
+        self.assertEqual(response.status_code, 413)
+
+    @unittest.skipIf(PILImage is None, 'Pillow is not installed')
+    def test_upload_image_variants(self):
+        json_response = self.login_as_admin()
+        data = BytesIO()
+        PILImage.new('RGB', (1000, 500), (255, 0, 0)).save(data, 'PNG')
+        response = self.client.post(
+            '/api/photos',
+            headers={'Content-Type': 'multipart/form-data', 'Authorization': json_response['token']},
+            data=dict(file=(BytesIO(data.getvalue()), "red.png"))
+        )
+        img = json.loads(response.get_data(as_text=True))
+        self.assertEqual(sorted(img['variants']), ['large', 'medium', 'small'])
+
+        response = self.client.get(img['variants']['small'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'image/png')
+        self.assertEqual(PILImage.open(BytesIO(response.get_data())).size, (320, 160))
+        response = self.client.get(img['variants']['small'], headers={'Accept': 'image/webp,*/*'})
+        self.assertEqual(response.mimetype, 'image/webp')
+        self.assertIn('Accept', response.headers['Vary'])
+        response = self.client.get(img['variants']['large'])
+        self.assertEqual(PILImage.open(BytesIO(response.get_data())).size, (1000, 500))
+
+        self.client.delete('/api/photos/{}'.format(img['filename']),
+                           headers={'Authorization': json_response['token']})
+        self.assertEqual(os.listdir(self.app.config['UPLOAD_FOLDER']), [])
 
     def test_delete_photo(self):
         response, json_response = self.upload_photo()
@@ -1,6 +1,7 @@
 import unittest
 from flask import current_app
 from app import create_app, db
+from app.pool import Pool
 
 
 class BasicsTestCase(unittest.TestCase):
@@ -19,4 +20,16 @@ class BasicsTestCase(unittest.TestCase):
         self.assertFalse(current_app is None)
 
     def test_app_is_testing(self):
-        self.assertTrue(current_app.config['TESTING'])
\ No newline at end of file
+        self.assertTrue(current_app.config['TESTING'])
+
+class PoolTestCase(unittest.TestCase):
+    def test_reuses_idle_objects_up_to_size(self):
+        made, closed = [], []
+        pool = Pool(lambda: made.append(len(made)) or made[-1], size=1, close=closed.append)
+        with pool.item() as first:
+            with pool.item() as second:
+                self.assertNotEqual(first, second)
+        self.assertEqual(closed, [first])
+        with pool.item() as again:
+            self.assertEqual(again, second)
+        self.assertEqual(len(made), 2)
@@ -0,0 +1,57 @@
+import unittest
+from app import create_app, db
+from benchmarks.compare import compare
+from benchmarks.explain import explain
+from benchmarks.startup import parse_importtime
+
+
+def run(**endpoints):
+    return {'results': {'client': endpoints}}
+
+
+class CompareTestCase(unittest.TestCase):
+    def test_flags_slower_latency_and_lower_throughput(self):
+        baseline = run(post={'p50': 10.0, 'p99': 20.0, 'rps': 100.0},
+                       archive={'p50': 2.0, 'p99': 4.0, 'rps': 500.0})
+        current = run(post={'p50': 10.5, 'p99': 30.0, 'rps': 80.0},
+                      archive={'p50': 1.0, 'p99': 2.0, 'rps': 900.0},
+                      search={'p50': 5.0, 'p99': 9.0, 'rps': 200.0})
+        rows = compare(baseline, current, threshold=0.1)
+        regressions = [(name, metric) for target, name, metric, before, after, change, regressed in rows
+                       if regressed]
+        self.assertEqual(regressions, [('post', 'p99'), ('post', 'rps')])
+        self.assertNotIn('search', [row[1] for row in rows])
+
+
+class StartupTestCase(unittest.TestCase):
+    def test_parse_importtime(self):
+        stderr = '\n'.join([
+            'import time: self [us] | cumulative | imported package',
+            'import time:       120 |        120 |     markdown.util',
+            'import time:      3000 |      31200 |   markdown',
+            'import time:     25000 |     640000 | blog',
+            'some warning'])
+        self.assertEqual(parse_importtime(stderr), {'markdown.util': (120, 120), 'markdown': (3000, 31200),
+                                                    'blog': (25000, 640000)})
+
+
+class ExplainTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_flags_full_scans(self):
+        if db.get_engine().dialect.name != 'sqlite':
+            self.skipTest('plans are read from sqlite')
+        rows, scanned = explain('SELECT image.id FROM image WHERE image.url = ?', ('/uploads/a.png',))
+        self.assertEqual(scanned, [])
+        self.assertTrue(rows)
+        rows, scanned = explain('SELECT comment.id FROM comment WHERE comment.body = ?', ('x',))
+        self.assertEqual(scanned, ['comment'])
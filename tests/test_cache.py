@@ -0,0 +1,76 @@
+import time
+import unittest
+from app import create_app, cache
+from app.cache import SimpleCache, RedisCache
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class SimpleCacheTestCase(unittest.TestCase):
+    def test_lru_eviction(self):
+        backend = SimpleCache(threshold=2)
+        backend.set('a', 1, 0)
+        backend.set('b', 2, 0)
+        backend.get('a')
+        backend.set('c', 3, 0)
+        self.assertEqual(backend.get('a'), 1)
+        self.assertIsNone(backend.get('b'))
+        self.assertEqual(backend.get('c'), 3)
+
+    def test_expiry(self):
+        backend = SimpleCache()
+        backend.set('a', 1, 0.01)
+        self.assertEqual(backend.get('a'), 1)
+        time.sleep(0.02)
+        self.assertIsNone(backend.get('a'))
+
+
+class CacheTestCase(unittest.TestCase):
+    backend = None
+
+    def setUp(self):
+        self.app = create_app('testing')
+        if self.backend is not None:
+            cache.init_app(self.app, backend=self.backend())
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+
+    def tearDown(self):
+        cache.clear()
+        self.app_context.pop()
+
+    def test_get_or_set_counts_hits_and_misses(self):
+        calls = []
+
+        def load():
+            calls.append(1)
+            return {'title': 'test'}
+
+        self.assertEqual(cache.get_or_set('post:1', load), {'title': 'test'})
+        self.assertEqual(cache.get_or_set('post:1', load), {'title': 'test'})
+        self.assertEqual(len(calls), 1)
+        stats = cache.stats()
+        self.assertEqual((stats['hits'], stats['misses']), (1, 1))
+
+    def test_delete(self):
+        cache.set('post:1', 'a')
+        cache.set('post:2', 'b')
+        cache.delete('post:1', 'post:3')
+        self.assertIsNone(cache.get('post:1'))
+        self.assertEqual(cache.get('post:2'), 'b')
+
+    def test_bump_changes_version(self):
+        version = cache.version('posts')
+        self.assertEqual(cache.version('posts'), version)
+        cache.bump('posts')
+        self.assertNotEqual(cache.version('posts'), version)
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisCacheTestCase(CacheTestCase):
+    @staticmethod
+    def backend():
+        return RedisCache(fakeredis.FakeStrictRedis(), 'test:')
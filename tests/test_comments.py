@@ -0,0 +1,124 @@
+import json
+import unittest
+from queue import Queue
+from app import create_app, db, user_datastore, background, comment_queue
+from app.comments import HiLoAllocator
+from app.models import Post, Category, Comment, IdSequence
+from sqlalchemy.exc import IntegrityError
+from flask_security.utils import hash_password
+
+
+class CommentQueueTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app.config['COMMENT_QUEUE_ENABLED'] = True
+        self.app.config['COMMENT_BATCH_SIZE'] = 2
+        self.app.extensions['comments']['queue'] = Queue(5)
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_posts(self, *titles):
+        author = user_datastore.create_user(email='author@example.com', name='author')
+        category = Category(name='python')
+        db.session.add_all([Post(title=title, author=author, category=category) for title in titles])
+        db.session.commit()
+
+    def login(self):
+        user_datastore.create_user(email='reader@example.com', name='reader', password=hash_password('123456'))
+        db.session.commit()
+        response = self.client.post('/api/sessions', headers={'Content-Type': 'application/json'},
+                                    data=json.dumps({'email': 'reader@example.com', 'password': '123456'}))
+        return json.loads(response.get_data(as_text=True))['token']
+
+    def comment(self, token, post_id, body):
+        return self.client.post('/api/comments/{}'.format(post_id),
+                                headers={'Content-Type': 'application/json', 'Authorization': token},
+                                data=json.dumps({'body': body}))
+
+    def test_allocator_blocks(self):
+        first = HiLoAllocator('comment', Comment.__table__, block_size=3)
+        second = HiLoAllocator('comment', Comment.__table__, block_size=3)
+        ids = [first.next_id(), second.next_id(), first.next_id(), first.next_id(), first.next_id()]
+        self.assertEqual(ids, [1, 4, 2, 3, 7])
+        self.assertEqual(IdSequence.query.get('comment').next_value, 10)
+
+        # rows written with ids of their own push the next block above them
+        db.session.execute(Comment.__table__.insert(), [{'id': 50, 'body': 'imported'}])
+        db.session.commit()
+        self.assertEqual([second.next_id(), second.next_id(), second.next_id()], [5, 6, 51])
+
+    def test_queued_comments(self):
+        token = self.login()
+        self.create_posts('a', 'b')
+        self.assertEqual(self.comment(token, 404, 'missing').status_code, 404)
+
+        accepted = []
+        for post_id, body in ((1, 'x'), (1, 'y'), (2, 'z')):
+            response = self.comment(token, post_id, body)
+            self.assertEqual(response.status_code, 202)
+            accepted.append(json.loads(response.get_data(as_text=True)))
+        self.assertEqual([c['id'] for c in accepted], ['1', '2', '3'])
+        self.assertEqual(accepted[2]['post'], 'b')
+        self.assertEqual(accepted[2]['author_name'], 'reader')
+        self.assertEqual(Comment.query.count(), 0)
+        # listed once the writer ran, and the cached page is dropped
+        page = json.loads(self.client.get('/api/comments/1').get_data(as_text=True))
+        self.assertEqual(page['count'], 0)
+
+        background.flush(self.app, 'comments')
+        self.assertEqual(comment_queue.pending(), 0)
+        page = json.loads(self.client.get('/api/comments/1').get_data(as_text=True))
+        self.assertEqual(page['count'], 2)
+        self.assertEqual([c['body'] for c in page['comments']], ['y', 'x'])
+        self.assertEqual(json.loads(self.client.get('/api/posts/2').get_data(as_text=True))['comment_count'], 1)
+
+    def test_full_queue_and_deleted_posts(self):
+        token = self.login()
+        self.create_posts('a', 'b')
+        for i in range(5):
+            self.assertEqual(self.comment(token, 1 + i % 2, str(i)).status_code, 202)
+        self.assertEqual(self.comment(token, 1, 'full').status_code, 503)
+
+        Post.query.filter_by(id=2).delete()
+        db.session.commit()
+        self.assertEqual(comment_queue.flush(), 5)
+        self.assertEqual(Comment.query.count(), 3)
+        self.assertEqual(Post.query.get(1).comment_count, 3)
+        self.assertEqual(self.comment(token, 1, 'again').status_code, 202)
+
+    def test_rejected_row_is_dropped(self):
+        self.app.config['COMMENT_RETRY_LIMIT'] = 1
+        token = self.login()
+        self.create_posts('a')
+        for body in ('x', 'y', 'z'):
+            self.assertEqual(self.comment(token, 1, body).status_code, 202)
+        # a row holding the id of the second comment makes its batch fail every time
+        db.session.execute(Comment.__table__.insert(), [{'id': 2, 'body': 'imported'}])
+        db.session.commit()
+
+        with self.assertRaises(IntegrityError):
+            comment_queue.flush()
+        self.assertEqual(comment_queue.pending(), 3)
+        self.assertEqual(comment_queue.flush(), 2)
+        self.assertEqual(comment_queue.pending(), 0)
+        self.assertEqual(sorted(c.body for c in Comment.query), ['imported', 'x', 'z'])
+        self.assertEqual(Post.query.get(1).comment_count, 2)
+        self.assertEqual(self.comment(token, 1, 'again').status_code, 202)
+
+    def test_direct_comments_take_allocated_ids(self):
+        self.app.config['COMMENT_QUEUE_ENABLED'] = False
+        token = self.login()
+        self.create_posts('a')
+        # a worker with the queue enabled reserved the first block
+        HiLoAllocator('comment', Comment.__table__, block_size=100).next_id()
+        response = self.comment(token, 1, 'direct')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(json.loads(response.get_data(as_text=True))['id'], '101')
+        self.assertEqual(Post.query.get(1).comment_count, 1)
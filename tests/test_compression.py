@@ -0,0 +1,90 @@
+import gzip
+import json
+import unittest
+from werkzeug.http import parse_accept_header
+from app import create_app, db, cache, user_datastore
+from app.compression import choose_encoding, brotli
+from app.models import Post, Category
+
+
+class CompressionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def create_posts(self, n):
+        user = user_datastore.create_user(email='a@example.com', name='a')
+        category = Category(name='python')
+        for i in range(n):
+            db.session.add(Post(title='post {}'.format(i), body='body', description='desc ' * 20, author=user,
+                                category=category))
+        db.session.commit()
+
+    def test_choose_encoding(self):
+        encoders = [('br', 'br encoder'), ('gzip', 'gzip encoder')]
+        choose = lambda header: choose_encoding(parse_accept_header(header), encoders)
+        self.assertEqual(choose('gzip, deflate, br'), ('br', 'br encoder'))
+        self.assertEqual(choose('gzip;q=1.0, br;q=0.5'), ('gzip', 'gzip encoder'))
+        self.assertEqual(choose('*'), ('br', 'br encoder'))
+        self.assertIsNone(choose('deflate'))
+        self.assertIsNone(choose('gzip;q=0'))
+        self.assertIsNone(choose(''))
+
+    def test_compressed_list(self):
+        self.create_posts(20)
+        plain = self.client.get('/api/posts')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        response = self.client.get('/api/posts', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response.headers['Vary'])
+        body = gzip.decompress(response.get_data())
+        self.assertEqual(json.loads(body.decode('utf-8')), json.loads(plain.get_data(as_text=True)))
+        self.assertEqual(int(response.headers['Content-Length']), len(response.get_data()))
+        self.assertLess(len(response.get_data()), len(body))
+
+        # the identity representation keeps the strong etag, the compressed one gets the weak form
+        etag = plain.headers['ETag']
+        self.assertEqual(response.headers['ETag'], 'W/' + etag)
+        for tag in (etag, response.headers['ETag']):
+            not_modified = self.client.get('/api/posts', headers={'If-None-Match': tag, 'Accept-Encoding': 'gzip'})
+            self.assertEqual(not_modified.status_code, 304)
+            self.assertIn('Accept-Encoding', not_modified.headers['Vary'])
+
+        # compressed once, the same body is served from the cache afterwards
+        hits = cache.stats()['hits']
+        again = self.client.get('/api/posts', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(again.get_data(), response.get_data())
+        self.assertGreater(cache.stats()['hits'], hits + 1)
+
+    def test_uncacheable_responses_are_not_cached(self):
+        self.create_posts(20)
+        for _ in range(2):
+            response = self.client.get('/api/posts/popular?limit=20', headers={'Accept-Encoding': 'gzip'})
+            self.assertEqual(response.headers['Content-Encoding'], 'gzip')
+        self.client.get('/api/posts', headers={'Accept-Encoding': 'gzip'})
+        backend = self.app.extensions['cache']['backend']
+        compressed = [key for key in backend._items if key.startswith('compressed:')]
+        self.assertEqual(compressed, ['compressed:gzip:' + self.client.get('/api/posts').headers['ETag'].strip('"')])
+
+    def test_small_responses_are_not_compressed(self):
+        response = self.client.get('/api/categories', headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('Content-Encoding', response.headers)
+        self.assertIsNone(response.headers.get('Vary'))
+
+    @unittest.skipIf(brotli is None, 'brotli is not installed')
+    def test_brotli(self):
+        self.create_posts(20)
+        response = self.client.get('/api/posts', headers={'Accept-Encoding': 'gzip, br'})
+        self.assertEqual(response.headers['Content-Encoding'], 'br')
+        json.loads(brotli.decompress(response.get_data()).decode('utf-8'))
@@ -0,0 +1,113 @@
+import os
+import shutil
+import tempfile
+import unittest
+from app import create_app, db, cache, user_datastore
+from app.models import Category, Post
+from config import config, TestingConfig
+
+
+class ReplicaTestCase(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        primary = 'sqlite:///' + os.path.join(self.tmpdir, 'primary.db')
+        replica = 'sqlite:///' + os.path.join(self.tmpdir, 'replica.db')
+
+        class ReplicaConfig(TestingConfig):
+            SQLALCHEMY_DATABASE_URI = primary
+            DATABASE_REPLICA_URIS = [replica]
+
+        config['replica-testing'] = ReplicaConfig
+        self.app = create_app('replica-testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.replica = self.app.extensions['replicas'][0]
+        db.Model.metadata.create_all(self.replica)
+
+        db.session.add(Category(name='on primary'))
+        db.session.commit()
+        self.replica.execute(Category.__table__.insert(), name='on replica')
+
+    def tearDown(self):
+        db.session.remove()
+        db.dispose_engines(self.app)
+        self.app_context.pop()
+        del config['replica-testing']
+        shutil.rmtree(self.tmpdir)
+        if os.path.exists(self.app.config['UPLOAD_FOLDER']):
+            shutil.rmtree(self.app.config['UPLOAD_FOLDER'])
+
+    def names(self):
+        return sorted(c.name for c in Category.query.all())
+
+    def test_get_reads_from_replica(self):
+        with self.app.test_request_context('/', method='GET'):
+            self.app.preprocess_request()
+            self.assertEqual(self.names(), ['on replica'])
+        with self.app.test_request_context('/', method='HEAD'):
+            self.app.preprocess_request()
+            self.assertEqual(self.names(), ['on replica'])
+
+    def test_writes_and_other_methods_use_primary(self):
+        self.assertEqual(self.names(), ['on primary'])
+        with self.app.test_request_context('/', method='POST'):
+            self.app.preprocess_request()
+            db.session.add(Category(name='posted'))
+            db.session.commit()
+            self.assertEqual(self.names(), ['on primary', 'posted'])
+
+    def test_read_your_writes_for_the_rest_of_the_request(self):
+        with self.app.test_request_context('/', method='GET'):
+            self.app.preprocess_request()
+            self.assertEqual(self.names(), ['on replica'])
+            db.session.add(Category(name='written'))
+            db.session.flush()
+            self.assertEqual(self.names(), ['on primary', 'written'])
+            db.session.commit()
+
+        with self.app.test_request_context('/', method='GET'):
+            self.app.preprocess_request()
+            self.assertEqual(self.names(), ['on replica'])
+
+    def test_dml_statement_pins_primary(self):
+        with self.app.test_request_context('/', method='GET'):
+            self.app.preprocess_request()
+            Category.query.filter_by(name='on primary').update({'name': 'renamed'})
+            self.assertEqual(self.names(), ['renamed'])
+            db.session.commit()
+
+    def test_api_reads_from_replica(self):
+        client = self.app.test_client()
+        response = client.get('/api/archive')
+        self.assertEqual(response.status_code, 200)
+
+    def test_cache_is_filled_from_primary(self):
+        author = user_datastore.create_user(email='author@example.com', name='author')
+        db.session.add(Post(title='new', body='body', author=author, category=Category.query.first()))
+        db.session.commit()
+        # the replica has not caught up with the edit yet
+        self.replica.execute(Post.__table__.insert(), id=1, title='old', body='body')
+
+        client = self.app.test_client()
+        response = client.get('/api/posts/1')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(cache.get('post:1')['title'], 'new')
+        with self.app.test_request_context('/', method='GET'):
+            self.app.preprocess_request()
+            self.assertEqual(Post.query.get(1).title, 'old')
+
+
+class PoolOptionsTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+
+    def test_mysql_gets_pool_settings(self):
+        options = db.pool_options(self.app, 'mysql+pymysql://root@localhost/flaskblog')
+        self.assertEqual(options['pool_size'], self.app.config['DATABASE_POOL_SIZE'])
+        self.assertEqual(options['pool_recycle'], self.app.config['DATABASE_POOL_RECYCLE'])
+        self.assertTrue(options['pool_pre_ping'])
+
+    def test_sqlite_only_gets_pre_ping(self):
+        options = db.pool_options(self.app, 'sqlite:////tmp/blog.db')
+        self.assertEqual(options, {'pool_pre_ping': True})
@@ -0,0 +1,102 @@
+import threading
+import unittest
+from app import create_app, db, background, view_counter
+from app.models import Post
+from app.popularity import ShardedCounter, SpaceSaving, SlidingTopK, RedisTopK
+
+try:
+    import fakeredis
+except ImportError:
+    fakeredis = None
+
+
+class SketchTestCase(unittest.TestCase):
+    def test_sharded_counter(self):
+        counter = ShardedCounter(4)
+
+        def count():
+            for i in range(1000):
+                counter.add(i % 10)
+        threads = [threading.Thread(target=count) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(counter.drain(), dict((i, 800) for i in range(10)))
+        self.assertEqual(counter.drain(), {})
+
+    def test_space_saving_keeps_heavy_keys(self):
+        sketch = SpaceSaving(3)
+        for key, n in [(1, 50), (2, 40), (3, 1), (4, 1), (5, 1), (6, 30)]:
+            sketch.add(key, n)
+        self.assertEqual(len(sketch.counts), 3)
+        self.assertEqual(sketch.counts[1], 50)
+        self.assertEqual(sketch.counts[2], 40)
+        # took over the smallest counter, overestimated by at most its count
+        self.assertEqual(sketch.counts[6], 33)
+
+    def test_sliding_window(self):
+        top = SlidingTopK(window=60, buckets=6, capacity=10)
+        top.update({1: 5, 2: 3}, now=1000)
+        top.update({2: 4, 3: 1}, now=1030)
+        self.assertEqual(top.top(2, now=1030), [(2, 7), (1, 5)])
+        # the bucket of 1000 is out of the window a minute later
+        self.assertEqual(top.top(5, now=1065), [(2, 4), (3, 1)])
+        self.assertEqual(top.top(5, now=1200), [])
+
+
+@unittest.skipIf(fakeredis is None, 'fakeredis is not installed')
+class RedisTopKTestCase(unittest.TestCase):
+    def test_workers_share_the_window(self):
+        client = fakeredis.FakeStrictRedis()
+        workers = [RedisTopK(client, 'test:popular:', window=60, buckets=6, capacity=10) for _ in range(2)]
+        workers[0].update({1: 5, 2: 3}, now=1000)
+        workers[1].update({2: 4, 3: 1}, now=1030)
+        self.assertEqual(workers[0].top(2, now=1030), [(2, 7), (1, 5)])
+        self.assertEqual(workers[1].top(2, now=1030), [(2, 7), (1, 5)])
+        self.assertEqual(workers[0].top(5, now=1065), [(2, 4), (3, 1)])
+        self.assertEqual(workers[1].top(5, now=1200), [])
+
+    def test_buckets_are_trimmed_to_capacity(self):
+        top = RedisTopK(fakeredis.FakeStrictRedis(), 'test:popular:', window=60, buckets=6, capacity=2)
+        top.update({1: 5, 2: 3, 3: 1}, now=1000)
+        self.assertEqual(top.top(5, now=1000), [(1, 5), (2, 3)])
+
+
+class ViewCounterTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def test_flush_writes_views_in_batch(self):
+        posts = [Post(title=str(i)) for i in range(3)]
+        db.session.add_all(posts)
+        db.session.commit()
+        updated = [post.updated_time for post in posts]
+        for post_id in (1, 1, 2, 1):
+            view_counter.hit(post_id)
+        self.assertEqual(Post.query.get(1).views, 0)
+
+        background.flush(self.app, 'views')
+        db.session.expire_all()
+        self.assertEqual([post.views for post in Post.query.order_by(Post.id)], [3, 1, 0])
+        self.assertEqual([post.updated_time for post in Post.query.order_by(Post.id)], updated)
+        self.assertEqual(view_counter.popular(5), [(1, 3), (2, 1)])
+
+    def test_job_thread_flushes(self):
+        Post.query.delete()
+        db.session.add(Post(title='a'))
+        db.session.commit()
+        job = self.app.extensions['background']['views']
+        job.interval = 60
+        view_counter.hit(1)
+        job.stop()
+        db.session.expire_all()
+        self.assertEqual(Post.query.get(1).views, 1)
@@ -0,0 +1,83 @@
+import json
+import unittest
+from collections import OrderedDict
+from flask_restful import fields, marshal
+from app import create_app, db, user_datastore
+from app.models import Post, Category, Comment, Image
+from app.resources import output
+from app.resources.serializers import compile_fields, dumps
+
+
+def plain(value):
+    # marshal builds OrderedDicts, the compiled serializers dicts with the same order
+    return json.loads(json.dumps(value))
+
+
+class SerializersTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+
+    def assertSameOutput(self, spec, data):
+        expected = marshal(data, spec)
+        result = compile_fields(spec)(data)
+        self.assertEqual(plain(result), plain(expected))
+        if isinstance(expected, OrderedDict):
+            self.assertEqual(list(result), list(expected))
+
+    def test_output_specs_match_marshal(self):
+        author = user_datastore.create_user(email='a@example.com', name='a')
+        python = Category(name='python')
+        with_image = Post(title='one', body='# one', description='d', author=author, category=python,
+                          img=Image(url='/api/photos/a.png', sha256='a'))
+        without_image = Post(title='two', body='two', description='d', author=author, category=python)
+        for post in (with_image, without_image):
+            post.render_body()
+            db.session.add(Comment(body='hi', post=post, author=author))
+        db.session.add_all([with_image, without_image])
+        db.session.commit()
+
+        with self.app.test_request_context():
+            posts = [with_image.to_summary_dict(), without_image.to_summary_dict()]
+            comments = [c.to_dict() for c in Comment.query]
+            for post in (with_image, without_image):
+                self.assertSameOutput(output.article_fields, post.to_dict())
+            self.assertSameOutput(output.article_list_fields, {'count': None, 'next_cursor': 'x', 'posts': posts})
+            self.assertSameOutput(output.article_list_fields, {'posts': []})
+            self.assertSameOutput(output.category_post_list_fields, {'count': 2, 'posts': posts})
+            self.assertSameOutput(output.search_list_fields, {'results': [dict(posts[0], snippet='<b>one</b>')]})
+            self.assertSameOutput(output.comment_list_fields, {'count': 2, 'next_cursor': None, 'comments': comments})
+            self.assertSameOutput(output.comment_fields, comments[0])
+            self.assertSameOutput(output.category_list_fields, {'categories': [python.to_dict()]})
+            self.assertSameOutput(output.user_list_fields, {'users': [author], 'count': 1})
+            self.assertSameOutput(output.user_fields, author)
+            self.assertSameOutput(output.img_fields, with_image.img.to_dict())
+            self.assertSameOutput(output.session_fields, {'id': 1, 'name': 'a', 'is_admin': 0, 'token': 't'})
+
+    def test_uncommon_fields_match_marshal(self):
+        spec = {
+            'renamed': fields.String(attribute='name'),
+            'dotted': fields.Integer(attribute='nested.value'),
+            'when': fields.DateTime(dt_format='iso8601'),
+            'tags': fields.List(fields.String),
+            'maybe': fields.Nested({'a': fields.Integer}, allow_null=True),
+            'fallback': fields.Nested({'a': fields.Integer}, default={}),
+            'raw': fields.Raw,
+            'inline': {'name': fields.String},
+        }
+        for data in ({'name': 'x', 'nested': {'value': '3'}, 'tags': ['a', 1], 'raw': [1]}, {}, None):
+            self.assertSameOutput(spec, data)
+        self.assertSameOutput(spec, [{'name': 'x'}, {'name': 'y'}])
+
+    def test_dumps(self):
+        data = {'title': 'ni hao 你好', 'count': 1, 'img': None}
+        self.assertEqual(json.loads(dumps(data).decode('utf-8')), data)
+        self.app.config['RESTFUL_JSON'] = {'sort_keys': True}
+        self.assertEqual(dumps({'b': 1, 'a': 2}), b'{"a": 2, "b": 1}\n')
@@ -0,0 +1,122 @@
+import os
+import json
+import shutil
+import tarfile
+import unittest
+from io import BytesIO
+from app import create_app, db, search, user_datastore
+from app.models import User, Post, Category, Comment, Image
+from app.transfer import write_archive, import_archive, TransferError, NotEmptyError
+from flask_security.utils import hash_password
+
+
+class TransferTestCase(unittest.TestCase):
+    def setUp(self):
+        self.app = create_app('testing')
+        self.app_context = self.app.app_context()
+        self.app_context.push()
+        db.create_all()
+        self.client = self.app.test_client()
+
+    def tearDown(self):
+        db.session.remove()
+        db.drop_all()
+        self.app_context.pop()
+        if os.path.exists(self.app.config['UPLOAD_FOLDER']):
+            shutil.rmtree(self.app.config['UPLOAD_FOLDER'])
+
+    def create_blog(self):
+        admin = user_datastore.create_user(email='admin@example.com', name='admin', password=hash_password('123456'))
+        user_datastore.add_role_to_user(admin, user_datastore.create_role(name='admin'))
+        reader = user_datastore.create_user(email='reader@example.com', name='reader')
+        python = Category(name='python')
+        for i in range(5):
+            post = Post(id=10 + i, title='post {}'.format(i), body='# body {}'.format(i), description='desc',
+                        author=admin, category=python)
+            post.render_body()
+            db.session.add(post)
+            db.session.add(Comment(body='comment {}'.format(i), post=post, author=reader))
+        os.makedirs(self.app.config['UPLOAD_FOLDER'], exist_ok=True)
+        with open(os.path.join(self.app.config['UPLOAD_FOLDER'], 'a.txt'), 'wb') as f:
+            f.write(b'attachment')
+        db.session.add(Image(url='/api/photos/a.txt', sha256='x', post_id=10))
+        db.session.commit()
+
+    def test_round_trip(self):
+        self.create_blog()
+        archive = BytesIO()
+        counts = write_archive(archive, batch_size=2)
+        self.assertEqual(counts, {'users': 2, 'categories': 1, 'posts': 5, 'comments': 5, 'images': 1, 'files': 1})
+
+        db.drop_all()
+        db.create_all()
+        shutil.rmtree(self.app.config['UPLOAD_FOLDER'])
+        # an existing account is matched by email instead of being duplicated
+        user_datastore.create_user(email='reader@example.com', name='reader')
+        db.session.commit()
+
+        archive.seek(0)
+        counts = import_archive(archive, batch_size=2)
+        self.assertEqual(counts, {'users': 1, 'categories': 1, 'posts': 5, 'comments': 5, 'images': 1, 'files': 1})
+        self.assertEqual(User.query.count(), 2)
+        post = Post.query.get(12)
+        self.assertEqual(post.title, 'post 2')
+        self.assertEqual(post.author.email, 'admin@example.com')
+        self.assertTrue(post.author.has_role('admin'))
+        self.assertEqual(post.comment_count, 1)
+        self.assertEqual(post.comments.one().author.email, 'reader@example.com')
+        self.assertEqual(Post.query.get(10).img.url, '/api/photos/a.txt')
+        self.assertEqual(search.count(), 5)
+        with open(os.path.join(self.app.config['UPLOAD_FOLDER'], 'a.txt'), 'rb') as f:
+            self.assertEqual(f.read(), b'attachment')
+
+        archive.seek(0)
+        with self.assertRaises(TransferError):
+            import_archive(archive)
+        with self.assertRaises(TransferError):
+            import_archive(BytesIO(b'not a tar'))
+
+    def test_conflicts(self):
+        self.create_blog()
+        archive = BytesIO()
+        write_archive(archive)
+        db.drop_all()
+        db.create_all()
+
+        # a leftover image would collide with the imported ids, nothing is imported
+        db.session.add(Image(url='/api/photos/b.txt'))
+        db.session.commit()
+        archive.seek(0)
+        with self.assertRaises(NotEmptyError):
+            import_archive(archive)
+        self.assertEqual(User.query.count(), 0)
+        Image.query.delete()
+        db.session.commit()
+
+        rows = b'\n'.join(json.dumps({'id': 1, 'body': body, 'author_id': None, 'post_id': None}).encode('utf-8')
+                          for body in ('a', 'b'))
+        duplicated = BytesIO()
+        with tarfile.open(fileobj=duplicated, mode='w') as tar:
+            for name, data in (('manifest.json', b'{"version": 1}'), ('comments.ndjson', rows)):
+                member = tarfile.TarInfo(name)
+                member.size = len(data)
+                tar.addfile(member, BytesIO(data))
+        duplicated.seek(0)
+        with self.assertRaises(TransferError):
+            import_archive(duplicated)
+        self.assertEqual(Comment.query.count(), 0)
+
+    def test_api(self):
+        self.create_blog()
+        self.assertNotEqual(self.client.get('/api/export').status_code, 200)
+        token = json.loads(self.client.post(
+            '/api/sessions', headers={'Content-Type': 'application/json'},
+            data=json.dumps({'email': 'admin@example.com', 'password': '123456'})).get_data(as_text=True))['token']
+        response = self.client.get('/api/export', headers={'Authorization': token})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.mimetype, 'application/gzip')
+
+        response = self.client.post('/api/import', headers={'Authorization': token,
+                                                            'Content-Type': 'application/gzip'},
+                                    data=response.get_data())
+        self.assertEqual(response.status_code, 409)